@@ -0,0 +1,552 @@
+"""
+オフラインのベンチマーク（X・Gemini・SMTP をローカルの代替に置き換えて計測）
+
+使い方:
+    python benchmark.py                                  # 100 / 1,000 / 20,000 件で計測
+    python benchmark.py --tweets 5000 --lists 4 --gemini-delay 1.5 --rate-limit 0.2
+    python benchmark.py --tweets 1000 --links           # リンクの展開も計測（httpx が必要）
+
+- X: ページ送り・通信待ちを再現する偽の twikit クライアント（合成ツイートを生成）
+- Gemini: 応答待ちと 429 エラーを再現する偽のクライアント
+- SMTP: 127.0.0.1 で動く簡易SMTPサーバー
+- リンク先: 127.0.0.1 で動く簡易HTTPサーバー（t.co 風のリダイレクトと記事のHTML）
+
+twikit・google-genai がなくても実行できる。作業用の一時フォルダを使うため、
+tweets.db・.last_run・要約キャッシュなど普段使うファイルには触れない。
+ピークメモリは tracemalloc で計測するため、処理時間はその分だけ遅めに出る
+（時間だけを正確に測りたいときは --no-memory）。
+"""
+import argparse
+import asyncio
+import contextlib
+import http.server
+import io
+import itertools
+import json
+import os
+import re
+import random
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+import main
+import metrics
+import settings_store
+import summary_cache
+import tweet_store
+
+TOPICS = [
+    "OpenAI が新しい推論モデルを発表", "Google Gemini のアップデートが開発者向けに公開",
+    "Anthropic が資金調達を発表", "Meta がマルチモーダルモデルをオープンソース化",
+    "新しいAIエージェントのフレームワークが登場", "AIチップのスタートアップがベンチマーク結果を公開",
+    "New open-weights model tops the leaderboard", "Tips: prompt caching cuts our API bill in half",
+]
+KEYWORDS = [
+    "benchmark", "agents", "latency", "pricing", "context", "vision", "tools", "safety", "eval", "API",
+    "推論", "学習", "データセット", "コスト", "精度", "速度", "マルチモーダル", "オープンソース", "RAG", "fine-tuning",
+]
+# 本文用の語彙（実際のツイートに近づけるため、カナの組み合わせで2,000語ほど作る）
+_KANA = "アイウエオカキクケコサシスセソタチツテトナニヌネノハヒフヘホマミムメモラリルレロ"
+WORDS = KEYWORDS + ["".join(p) for p in itertools.product(_KANA, repeat=3)][::37][:2000]
+
+
+# --- 偽の X (twikit) ---
+
+class FakeUser:
+    def __init__(self, screen_name):
+        self.screen_name = screen_name
+
+
+def _graphql_payload(tweet_id, user, text, created):
+    """twikit の Tweet が保持している GraphQL の応答（_data）に近い大きさの dict"""
+    return {
+        "__typename": "Tweet",
+        "rest_id": str(tweet_id),
+        "core": {"user_results": {"result": {
+            "__typename": "User", "rest_id": str(hash(user) & 0xFFFFFFFF), "is_blue_verified": False,
+            "legacy": {
+                "screen_name": user, "name": user.title(), "created_at": created,
+                "description": "AI・機械学習の最新情報を発信しています。" * 3,
+                "location": "Tokyo, Japan", "followers_count": 1234, "friends_count": 567,
+                "statuses_count": 8910, "profile_image_url_https": f"https://pbs.twimg.com/profile_images/{user}.jpg",
+                "entities": {"description": {"urls": []}, "url": {"urls": []}},
+            },
+        }}},
+        "legacy": {
+            "full_text": text, "created_at": created, "id_str": str(tweet_id), "lang": "ja",
+            "favorite_count": 0, "retweet_count": 0, "reply_count": 0, "quote_count": 0, "bookmark_count": 0,
+            "entities": {"hashtags": [{"text": "AI", "indices": [0, 3]}], "symbols": [], "user_mentions": [],
+                         "urls": [{"url": "https://t.co/x", "expanded_url": "https://example.com/article",
+                                   "display_url": "example.com/article", "indices": [0, 23]}]},
+            "conversation_id_str": str(tweet_id), "is_quote_status": False, "possibly_sensitive": False,
+        },
+        "views": {"count": "12345", "state": "EnabledWithCount"},
+        "source": '<a href="https://mobile.twitter.com" rel="nofollow">Twitter Web App</a>',
+        "edit_control": {"edit_tweet_ids": [str(tweet_id)], "editable_until_msecs": "0", "edits_remaining": "5"},
+    }
+
+
+class FakeTweet:
+    def __init__(self, tweet_id, created_at, user, text, rng, retweeted_tweet=None):
+        self.id = str(tweet_id)
+        self.created_at_datetime = created_at
+        self.created_at = created_at.strftime("%a %b %d %H:%M:%S %z %Y")
+        self.user = FakeUser(user)
+        self.text = text
+        self.favorite_count = rng.randint(0, 500)
+        self.retweet_count = rng.randint(0, 100)
+        self.retweeted_tweet = retweeted_tweet
+        self._data = None
+
+    def materialize(self):
+        """ページとして返すときに GraphQL の応答を持たせる（twikit は取得のたびに新しい Tweet を作る）"""
+        tweet = FakeTweet.__new__(FakeTweet)
+        tweet.__dict__.update(self.__dict__)
+        tweet._data = _graphql_payload(self.id, self.user.screen_name, self.text, self.created_at)
+        return tweet
+
+
+class FakePage(list):
+    def __init__(self, items, client, list_id, offset):
+        super().__init__(items)
+        self._client = client
+        self._list_id = list_id
+        self._offset = offset
+
+    async def next(self):
+        return await self._client._page(self._list_id, self._offset + len(self))
+
+
+class FakeXClient:
+    """合成ツイートを新しい順に page_size 件ずつ返す。隣り合うリストとは約2割のツイートが重複する"""
+
+    OVERLAP = 0.2
+
+    def __init__(self, tweets_per_list, lists=1, page_size=20, latency=0.02, seed=0, link_prefix="https://t.co/"):
+        self.tweets_per_list = tweets_per_list
+        self.link_prefix = link_prefix
+        self.page_size = page_size
+        self.latency = latency
+        self.requests = 0
+        self._timelines = {}
+        self._rng = random.Random(seed)
+        self._now = datetime.now(timezone.utc)
+        self._stride = max(1, int(tweets_per_list * (1 - self.OVERLAP)))
+        self._pool = self._make_pool(self._stride * (lists - 1) + tweets_per_list)
+
+    def _make_pool(self, n):
+        pool = []
+        for i in range(n):
+            created = self._now - timedelta(seconds=int(23 * 3600 * i / n))
+            user = f"user{self._rng.randrange(300)}"
+            roll = self._rng.random()
+            if pool and roll < 0.15:
+                # リツイート
+                original = self._rng.choice(pool[-200:])
+                text = f"RT @{original.user.screen_name}: {original.text}"
+                tweet = FakeTweet(10**18 - i, created, user, text, self._rng, retweeted_tweet=original)
+            elif roll < 0.35:
+                # 同じ発表をほぼ同じ文面で投稿
+                topic = self._rng.choice(TOPICS)
+                text = f"{topic} {self.link_prefix}{self._rng.randrange(50)} #AI"
+                tweet = FakeTweet(10**18 - i, created, user, text, self._rng)
+            else:
+                words = " ".join(self._rng.choice(WORDS) for _ in range(self._rng.randint(8, 30)))
+                text = f"{self._rng.choice(TOPICS)}: {words} {self.link_prefix}{i} #{self._rng.choice(KEYWORDS)}"
+                tweet = FakeTweet(10**18 - i, created, user, text, self._rng)
+            pool.append(tweet)
+        return pool
+
+    def _timeline(self, list_id):
+        """リストごとのタイムライン（プールの一部を、リストごとに開始位置をずらして切り出す）"""
+        if list_id not in self._timelines:
+            start = self._stride * (int(list_id) - 1)
+            self._timelines[list_id] = sorted(self._pool[start:start + self.tweets_per_list],
+                                              key=lambda t: t.created_at_datetime, reverse=True)
+        return self._timelines[list_id]
+
+    async def _page(self, list_id, offset):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        items = [t.materialize() for t in self._timeline(list_id)[offset:offset + self.page_size]]
+        return FakePage(items, self, list_id, offset)
+
+    async def get_list_tweets(self, list_id, count=20, cursor=None):
+        return await self._page(list_id, 0)
+
+
+# --- 偽の Gemini ---
+
+class FakeAPIError(Exception):
+    """google.genai.errors.APIError と同じく code / details を持つ例外"""
+
+    def __init__(self, code, retry_delay):
+        super().__init__(f"{code} RESOURCE_EXHAUSTED")
+        self.code = code
+        self.details = {"error": {"code": code, "details": [{"retryDelay": f"{retry_delay}s"}]}}
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModels:
+    def __init__(self, delay, chars_per_second, rate_limit, retry_delay, seed=0, batch_invalid=0.0):
+        self.delay = delay
+        self.chars_per_second = chars_per_second
+        self.rate_limit = rate_limit
+        self.retry_delay = retry_delay
+        self.batch_invalid = batch_invalid
+        self.calls = 0
+        self.rate_limited = 0
+        self._rng = random.Random(seed)
+
+    def _summary(self, contents):
+        lines = [line for line in contents.splitlines() if line.startswith("@")][:5]
+        return "🤖 AI新モデル・技術発表\n" + "\n".join(f"- {line[:80]}" for line in lines) + \
+            "\n\n本日の注目ポイント: ベンチマーク用の要約です。"
+
+    def _batch(self, contents):
+        """一括要約（JSON）の応答。batch_invalid の割合で highlight が欠けた不正なオブジェクトを返す"""
+        items = []
+        for job_id, body in re.findall(r"=== 依頼 (job\d+) ===\n(.*?)(?=\n\n=== 依頼 |\Z)", contents, re.S):
+            lines = [line for line in body.splitlines() if line.startswith("@")][:5]
+            item = {"job_id": job_id, "models": [line[:80] for line in lines],
+                    "industry": [], "tips": [], "business": [], "others": []}
+            if self._rng.random() >= self.batch_invalid:
+                item["highlight"] = "ベンチマーク用の要約です。"
+            items.append(item)
+        return json.dumps(items, ensure_ascii=False)
+
+    async def _wait(self, contents):
+        self.calls += 1
+        if self._rng.random() < self.rate_limit:
+            self.rate_limited += 1
+            await asyncio.sleep(0.01)
+            raise FakeAPIError(429, self.retry_delay)
+        await asyncio.sleep(self.delay + len(contents) / self.chars_per_second)
+
+    async def generate_content(self, model, contents, config=None):
+        await self._wait(contents)
+        if config and config.get("response_schema"):
+            return FakeResponse(self._batch(contents))
+        return FakeResponse(self._summary(contents))
+
+    async def generate_content_stream(self, model, contents, config=None):
+        await self._wait(contents)
+        text = self._summary(contents)
+
+        async def chunks():
+            for i in range(0, len(text), 40):
+                await asyncio.sleep(0)
+                yield FakeResponse(text[i:i + 40])
+        return chunks()
+
+
+class FakeGeminiClient:
+    def __init__(self, **kwargs):
+        self.aio = type("Aio", (), {})()
+        self.aio.models = FakeModels(**kwargs)
+
+
+# --- ローカルSMTPサーバー ---
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """EHLO / AUTH / MAIL / RCPT / DATA / QUIT だけに応答する最小限のSMTP"""
+
+    def _reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        self.server.connections += 1
+        self._reply("220 localhost benchmark SMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line.decode("ascii", "replace").strip().split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self.wfile.write(b"250-localhost\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+            elif verb == "AUTH":
+                self._reply("235 Authentication successful")
+            elif verb in ("MAIL", "RCPT", "RSET", "NOOP"):
+                self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                self.server.messages += 1
+                self._reply("250 OK queued")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class LocalSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.messages = 0
+        self.connections = 0
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+# --- ローカルHTTPサーバー（リンク先の記事） ---
+
+class _ArticleHandler(http.server.BaseHTTPRequestHandler):
+    """/r/N は /article/N へのリダイレクト（t.co の代わり）、/article/N は記事のHTMLを返す"""
+
+    protocol_version = "HTTP/1.1"  # keep-alive で接続が使い回されるか確認できるように
+
+    def do_GET(self):
+        self.server.requests += 1
+        time.sleep(self.server.latency)
+        if self.path.startswith("/r/"):
+            self.send_response(301)
+            self.send_header("Location", "/article/" + self.path[3:])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        n = self.path.rsplit("/", 1)[-1]
+        body = (
+            f"<html><head><meta charset='utf-8'><title>記事 {n} | AI News</title>"
+            f"<meta property='og:title' content='AIニュース記事 {n}'>"
+            f"<meta property='og:description' content='記事 {n} の概要: {TOPICS[int(n) % len(TOPICS)]}'>"
+            f"</head><body>{'本文' * 20000}</body></html>"
+        ).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalHTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency=0.005):
+        super().__init__(("127.0.0.1", 0), _ArticleHandler)
+        self.latency = latency
+        self.requests = 0
+        self.connections = 0
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+# --- 計測 ---
+
+class StageTimer:
+    """段階ごとの処理時間とピークメモリ（tracemalloc）を記録"""
+
+    def __init__(self):
+        self.results = []
+
+    @contextlib.contextmanager
+    def stage(self, name, items=0):
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        record = {"stage": name, "items": items}
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            if tracemalloc.is_tracing():
+                record["peak_mb"] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            self.results.append(record)
+
+
+def _configure(workdir, args, smtp_port, tweets_per_list):
+    """本番のファイルに触れないよう、保存先を作業フォルダに向けて設定を適用"""
+    main.LAST_RUN_FILE = os.path.join(workdir, ".last_run")
+    main.WATERMARK_FILE = os.path.join(workdir, ".watermark.json")
+    main.OUTPUT_DIR = os.path.join(workdir, "output")
+    main.OUTBOX_DIR = os.path.join(workdir, "outbox")
+    main.CHECKPOINT_DIR = os.path.join(workdir, "checkpoints")
+    metrics.METRICS_FILE = os.path.join(workdir, "metrics.jsonl")
+    metrics.TOTALS_FILE = os.path.join(workdir, "metrics_totals.json")
+    tweet_store.DB_FILE = os.path.join(workdir, "tweets.db")
+    summary_cache.CACHE_DIR = os.path.join(workdir, "summary_cache")
+    if args.links:
+        import link_preview
+        link_preview.CACHE_FILE = os.path.join(workdir, "link_cache.db")
+
+    # 宛先ごとに受け取るリストの組み合わせを変えて、audiences 種類の要約を作る
+    subsets = [list(c) for n in range(args.lists, 0, -1)
+               for c in itertools.combinations(range(1, args.lists + 1), n)][:args.audiences]
+    recipients = [
+        {"email": f"member{i}@example.com", "lists": [str(n) for n in subsets[i % len(subsets)]]}
+        for i in range(max(args.recipients, args.audiences))
+    ]
+
+    settings = dict(settings_store.DEFAULTS)
+    settings.update({
+        "list_urls": [f"https://x.com/i/lists/{i}" for i in range(1, args.lists + 1)],
+        "gmail_user": "bench@example.com",
+        "gmail_app_password": "bench",
+        "smtp_host": "127.0.0.1",
+        "smtp_port": smtp_port,
+        "smtp_ssl": False,
+        "smtp_allow_plaintext": True,  # ローカルのSMTPサーバーは STARTTLS に対応しない
+        "recipients": recipients,
+        "max_pages": tweets_per_list // args.page_size + 2,
+        "retry_max_delay": 5,
+        "retry_attempts": 6,
+        "stream_summary": args.stream,
+        "preprocess_workers": args.workers,
+        "enrich_links": args.links,
+        "summary_batch_tokens": 0 if args.no_batch else settings_store.DEFAULTS["summary_batch_tokens"],
+    })
+    main._apply_settings(settings)
+
+
+async def run_scale(total, args):
+    """total 件（全リスト合計）でパイプラインを1回実行して各段階を計測"""
+    tweets_per_list = max(1, total // args.lists)
+    timer = StageTimer()
+    gemini = FakeGeminiClient(
+        delay=args.gemini_delay, chars_per_second=args.gemini_cps,
+        rate_limit=args.rate_limit, retry_delay=args.retry_delay, seed=total, batch_invalid=args.batch_invalid
+    )
+
+    with tempfile.TemporaryDirectory() as workdir, LocalSMTPServer() as smtp, \
+            (LocalHTTPServer(args.link_latency) if args.links else contextlib.nullcontext()) as http_server:
+        link_prefix = f"http://127.0.0.1:{http_server.server_address[1]}/r/" if http_server else "https://t.co/"
+        x_client = FakeXClient(tweets_per_list, args.lists, args.page_size, args.page_latency, seed=total,
+                               link_prefix=link_prefix)
+        _configure(workdir, args, smtp.server_address[1], tweets_per_list)
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with quiet:
+            groups = main.recipient_groups()
+            with tweet_store.TweetStore() as store:
+                marks = main.load_watermarks()
+                since = main.window_starts(marks, main.LIST_IDS)
+                with timer.stage("fetch") as record:
+                    await main.fetch_all_lists(store, marks, x_client)
+                    rows_by_group = {main._group_key(ids): store.get_window(list(ids), since) for ids in groups}
+                    record["items"] = sum(len(rows) for rows in rows_by_group.values())
+
+            with timer.stage("preprocess", record["items"]) as record:
+                entries_by_group = {}
+                for key in list(rows_by_group):
+                    entries_by_group[key] = await main.preprocess_tweets(rows_by_group.pop(key))
+                record["out"] = sum(len(entries) for entries in entries_by_group.values())
+
+            with timer.stage("summarize", record["out"]):
+                summaries = await main.summarize_groups(
+                    groups, entries_by_group, {key: [] for key in entries_by_group}, gemini
+                )
+
+            with timer.stage("send", sum(len(recipients) for recipients in groups.values())):
+                await main.deliver([(recipients, summaries[main._group_key(ids)])
+                                    for ids, recipients in groups.items()])
+
+        extra = {
+            "x_requests": x_client.requests,
+            "gemini_calls": gemini.aio.models.calls,
+            "rate_limited": gemini.aio.models.rate_limited,
+            "mails": smtp.messages,
+            "smtp_connections": smtp.connections,
+        }
+        if http_server:
+            extra["http_requests"] = http_server.requests
+            extra["http_connections"] = http_server.connections
+    return timer.results, extra
+
+
+def _report(total, results, extra):
+    print(f"\n■ {total:,} 件  (X {extra['x_requests']}リクエスト, Gemini {extra['gemini_calls']}回"
+          f" うち429 {extra['rate_limited']}回, メール {extra['mails']}通/接続{extra['smtp_connections']}回)")
+    if "http_requests" in extra:
+        print(f"  リンク先 {extra['http_requests']}リクエスト/接続{extra['http_connections']}回")
+    print(f"  {'段階':<12}{'件数':>8}{'時間(秒)':>12}{'件/秒':>12}{'ピーク(MB)':>12}")
+    for r in results:
+        rate = r["items"] / r["seconds"] if r["seconds"] else 0
+        peak = f"{r['peak_mb']:.1f}" if "peak_mb" in r else "-"
+        print(f"  {r['stage']:<12}{r['items']:>8}{r['seconds']:>12.3f}{rate:>12.0f}{peak:>12}")
+    print(f"  {'合計':<12}{'':>8}{sum(r['seconds'] for r in results):>12.3f}")
+    rss = _max_rss_mb()
+    if rss is not None:
+        print(f"  プロセスの最大RSS: {rss:.1f} MB（ここまでの全規模での最大値）")
+
+
+def _max_rss_mb():
+    """プロセスの最大常駐メモリ（MB）。resource がない Windows では None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト単位
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="X・Gemini・SMTP をローカルの代替にしたオフラインベンチマーク")
+    parser.add_argument("--tweets", type=int, nargs="+", default=[100, 1000, 20000],
+                        help="全リスト合計のツイート数（複数指定可）")
+    parser.add_argument("--lists", type=int, default=3, help="リスト数")
+    parser.add_argument("--page-size", type=int, default=20, help="1ページあたりの件数")
+    parser.add_argument("--page-latency", type=float, default=0.02, help="X 1ページあたりの待ち時間（秒）")
+    parser.add_argument("--gemini-delay", type=float, default=0.5, help="Gemini 1回あたりの固定待ち時間（秒）")
+    parser.add_argument("--gemini-cps", type=float, default=200000, help="Gemini の入力処理速度（文字/秒）")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Gemini が 429 を返す確率 (0〜1)")
+    parser.add_argument("--retry-delay", type=float, default=0.5, help="429 のときに返す retryDelay（秒）")
+    parser.add_argument("--recipients", type=int, default=1, help="送信先の数")
+    parser.add_argument("--audiences", type=int, default=1,
+                        help="受け取るリストの組み合わせの数（この数だけ別々の要約を作る。最大 2^リスト数-1）")
+    parser.add_argument("--no-batch", action="store_true", help="複数の要約を1回のリクエストにまとめない")
+    parser.add_argument("--batch-invalid", type=float, default=0.0,
+                        help="一括要約で Gemini が不正な形式の結果を返す割合 (0〜1)")
+    parser.add_argument("--workers", type=int, default=0, help="前処理のプロセス数（0 ならCPUコア数、1 なら並列化しない）")
+    parser.add_argument("--links", action="store_true", help="ローカルのHTTPサーバーでリンクの展開も計測")
+    parser.add_argument("--link-latency", type=float, default=0.005, help="リンク先 1リクエストあたりの待ち時間（秒）")
+    parser.add_argument("--stream", action="store_true", help="要約をストリーミングモードで生成")
+    parser.add_argument("--no-memory", action="store_true", help="tracemalloc を使わない（時間の計測が正確になる）")
+    parser.add_argument("--verbose", action="store_true", help="パイプラインのログも表示")
+    args = parser.parse_args()
+    if not 1 <= args.audiences < 2 ** args.lists:
+        parser.error(f"--audiences は 1〜{2 ** args.lists - 1} の範囲で指定してください")
+
+    if not args.no_memory:
+        tracemalloc.start()
+    for total in args.tweets:
+        results, extra = asyncio.run(run_scale(total, args))
+        _report(total, results, extra)
+    tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,92 @@
+"""
+段階ごとのチェックポイント（取得→前処理→要約→送信）
+
+各段階の結果を checkpoints/YYYYMMDD/ に保存し、manifest.json に完了した段階を記録する。
+要約で失敗した場合も、次の実行では保存済みの取得・前処理の結果から再開するため、
+X の取得や済んだ Gemini 呼び出しをやり直さずに済む。
+リストや宛先の設定が変わった場合は、その日のチェックポイントを使わずに最初からやり直す。
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from jsonfile import write_atomic
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CHECKPOINT_DIR = os.path.join(SCRIPT_DIR, "checkpoints")
+
+STAGES = ("fetch", "preprocess", "summarize", "send")
+KEEP_DAYS = 7  # これより古い日のチェックポイントは削除
+
+
+def make_key(*parts):
+    """チェックポイントを使い回してよい設定かを判定するためのキー"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+class Checkpoint:
+    """1日分のチェックポイント"""
+
+    def __init__(self, key, day=None, base_dir=None):
+        self.base_dir = base_dir or CHECKPOINT_DIR
+        self.day = day or time.strftime("%Y%m%d")
+        self.dir = os.path.join(self.base_dir, self.day)
+        self.manifest_path = os.path.join(self.dir, "manifest.json")
+        self.manifest = {"date": self.day, "key": key, "stages": {}}
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+        if manifest.get("key") == key:
+            self.manifest = manifest
+        else:
+            print("  ⚠️ リスト・宛先の設定が変わったため、本日のチェックポイントは使いません")
+
+    def completed(self, stage):
+        return self.manifest["stages"].get(stage, {}).get("completed", False)
+
+    def resume_stage(self):
+        """次に実行すべき段階（すべて完了していれば None）"""
+        for stage in STAGES:
+            if not self.completed(stage):
+                return stage
+        return None
+
+    def load(self, stage):
+        """保存済みの段階の結果（なければ None）"""
+        info = self.manifest["stages"].get(stage)
+        if not info:
+            return None
+        try:
+            with open(os.path.join(self.dir, info["file"]), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, stage, data, completed=True):
+        """段階の結果を保存して manifest を更新（completed=False は途中経過）
+
+        段階をやり直した場合は、それより後の段階の記録を消す。
+        """
+        os.makedirs(self.dir, exist_ok=True)
+        filename = f"{stage}.json"
+        write_atomic(os.path.join(self.dir, filename), data)
+        stages = self.manifest["stages"]
+        for later in STAGES[STAGES.index(stage) + 1:]:
+            stages.pop(later, None)
+        stages[stage] = {"file": filename, "completed": completed, "saved_at": time.time()}
+        write_atomic(self.manifest_path, self.manifest)
+
+
+def prune(base_dir=None, keep_days=KEEP_DAYS):
+    """古い日のチェックポイントを削除"""
+    base_dir = base_dir or CHECKPOINT_DIR
+    if not os.path.isdir(base_dir):
+        return
+    oldest = time.strftime("%Y%m%d", time.localtime(time.time() - keep_days * 86400))
+    for name in os.listdir(base_dir):
+        if name.isdigit() and name < oldest:
+            shutil.rmtree(os.path.join(base_dir, name), ignore_errors=True)
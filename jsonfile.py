@@ -0,0 +1,18 @@
+"""
+状態ファイル（JSON）の安全な書き込み
+
+一時ファイルに書いて fsync してから os.replace で置き換えるため、
+書き込み中に落ちても元のファイルか新しいファイルのどちらかが必ず残る（途中で切れたJSONにならない）。
+"""
+import json
+import os
+
+
+def write_atomic(path, data, indent=None):
+    """data を JSON として path に書き込む（置き換えは一度に行う）"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=indent, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -0,0 +1,268 @@
+"""
+リンク先のタイトル・概要の取得（リンクの展開）
+
+AI関連の投稿は「見出し＋t.coリンク」だけのことが多く、本文だけでは記事の中身が要約に入らない。
+投稿中のURLをたどってページの og:title / <title> と og:description を取り出し、
+プロンプトの 🔗 の代わりに「🔗「タイトル」概要」として渡す。
+
+- httpx.AsyncClient を1つだけ使い回し（接続プール）、ホストごとの同時接続数を制限する
+  （t.co → 記事サイトのリダイレクトも1ホップずつたどり、ホストごとの制限をかける）
+- 1リクエストごとのタイムアウト（ホストの枠を得てから数える）と読み込むサイズの上限（<head> が読めれば足りる）
+- 結果は URL をキーに .link_cache.db に保存し、有効期限内は再取得しない
+  （同じ記事は何度も共有されるため、2回目以降はほぼ通信しない。失敗も短時間キャッシュする）
+"""
+import asyncio
+import html
+import os
+import re
+import sqlite3
+import time
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+import httpx
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_FILE = os.path.join(SCRIPT_DIR, ".link_cache.db")
+
+URL_RE = re.compile(r"https?://[^\s　]+")
+URL_TRAILING = ".,:;!?)]}」』）】、。！？"  # URLの直後に続きやすい句読点・括弧
+
+PER_HOST = 4  # 1ホストあたりの同時接続数
+HOST_LIMITS = {"t.co": 8}  # すべてのリンクが通る短縮URLのホストは多めにする
+MAX_BYTES = 256 * 1024  # 1ページあたりに読み込む上限
+MAX_REDIRECTS = 5
+FAILURE_TTL = 3600  # 取得に失敗したURLを再試行しない時間（秒）
+TITLE_CHARS = 80
+DESCRIPTION_CHARS = 120
+USER_AGENT = "Mozilla/5.0 (compatible; x-summary/3.0; +link-preview)"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS links (
+    url TEXT PRIMARY KEY,
+    final_url TEXT,
+    title TEXT,
+    description TEXT,
+    ok INTEGER NOT NULL,
+    fetched_at INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def extract_urls(text):
+    """本文中のURL（末尾の句読点・閉じ括弧は除く）を出現順に重複なく返す"""
+    urls = []
+    for match in URL_RE.finditer(text):
+        url = match.group(0).rstrip(URL_TRAILING)
+        if url not in urls:
+            urls.append(url)
+    return urls
+
+
+def _shorten(text, limit):
+    text = " ".join(html.unescape(text or "").split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+class _HeadParser(HTMLParser):
+    """<head> 内の <title> と meta（og:title / og:description / description）を集める"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.meta = {}
+        self.title = ""
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title":
+            self._in_title = True
+        elif tag == "meta":
+            attrs = dict(attrs)
+            key = (attrs.get("property") or attrs.get("name") or "").lower()
+            if key in ("og:title", "twitter:title", "og:description", "twitter:description", "description"):
+                self.meta.setdefault(key, attrs.get("content") or "")
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+
+
+def parse_head(markup):
+    """HTMLからタイトルと概要を取り出す: (title, description)"""
+    end = markup.lower().find("</head>")
+    parser = _HeadParser()
+    try:
+        parser.feed(markup if end < 0 else markup[:end])
+    except Exception:  # 壊れたHTMLでも、それまでに読めた分を使う
+        pass
+    meta = parser.meta
+    title = meta.get("og:title") or meta.get("twitter:title") or parser.title
+    description = meta.get("og:description") or meta.get("twitter:description") or meta.get("description")
+    return _shorten(title, TITLE_CHARS), _shorten(description, DESCRIPTION_CHARS)
+
+
+class LinkCache:
+    """URL をキーにしたリンク情報のキャッシュ（SQLite、有効期限つき）"""
+
+    def __init__(self, path=None, ttl_days=7):
+        self.conn = sqlite3.connect(path or CACHE_FILE)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.ttl = ttl_days * 86400
+
+    def close(self):
+        self.conn.close()
+
+    def get(self, url):
+        """有効期限内のリンク情報（なければ None。失敗の記録は {"ok": False}）"""
+        row = self.conn.execute(
+            "SELECT final_url, title, description, ok, fetched_at FROM links WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        final_url, title, description, ok, fetched_at = row
+        if time.time() - fetched_at > (self.ttl if ok else FAILURE_TTL):
+            return None
+        return {"url": final_url, "title": title, "description": description, "ok": bool(ok)}
+
+    def put(self, url, info):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO links (url, final_url, title, description, ok, fetched_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (url, info.get("url"), info.get("title"), info.get("description"),
+                 1 if info["ok"] else 0, int(time.time()))
+            )
+
+    def prune(self):
+        """期限切れの記録を削除"""
+        now = int(time.time())
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM links WHERE fetched_at < ? OR (ok = 0 AND fetched_at < ?)",
+                (now - self.ttl, now - FAILURE_TTL)
+            )
+
+
+class LinkPreviewer:
+    """1つの接続プールでリンク先を並行して取得する
+
+    async with LinkPreviewer(cache) as previewer:
+        info = await previewer.preview(url)
+    """
+
+    def __init__(self, cache, concurrency=16, per_host=PER_HOST, timeout=10, transport=None):
+        self.cache = cache
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.transport = transport
+        self.client = None
+        self.fetched = 0
+        self.cache_hits = 0
+        self.failures = 0
+        self._hosts = {}
+        self._inflight = {}
+        self._slots = asyncio.Semaphore(concurrency)  # 同時に取得するURLの数
+
+    async def __aenter__(self):
+        self.client = httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT, "Accept": "text/html,application/xhtml+xml"},
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+            timeout=httpx.Timeout(self.timeout),
+            follow_redirects=False,
+            transport=self.transport,
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc.lower()
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(max(self.per_host, HOST_LIMITS.get(host, 0)))
+        return self._hosts[host]
+
+    async def _get_head(self, url):
+        """1ホップ分のリクエスト: (リダイレクト先 or None, HTML or None)
+
+        タイムアウトはホストの枠を得てから数える（ほかのリンクの順番待ちで時間切れにしない）。
+        """
+        async with self._host_limit(url):
+            return await asyncio.wait_for(self._request(url), timeout=self.timeout)
+
+    async def _request(self, url):
+        async with self.client.stream("GET", url) as response:
+            # 最後まで読んだレスポンスの接続だけがプールに戻るため、小さい本文は読み切る
+            length = int(response.headers.get("content-length") or MAX_BYTES + 1)
+            if response.is_redirect:
+                if length <= MAX_BYTES:
+                    await response.aread()
+                return urljoin(url, response.headers.get("location", "")), None
+            response.raise_for_status()
+            if "html" not in response.headers.get("content-type", "html"):
+                return None, None
+            body = b""
+            async for chunk in response.aiter_bytes():
+                body += chunk
+                if len(body) >= MAX_BYTES or (length > MAX_BYTES and b"</head>" in chunk.lower()):
+                    break
+        return None, body[:MAX_BYTES].decode(response.encoding or "utf-8", errors="replace")
+
+    async def _fetch(self, url):
+        current = url
+        for _ in range(MAX_REDIRECTS + 1):
+            location, markup = await self._get_head(current)
+            if location is None:
+                break
+            current = location
+        else:
+            raise httpx.TooManyRedirects(f"リダイレクトが多すぎます: {url}")
+        title, description = parse_head(markup) if markup else ("", "")
+        return {"url": current, "title": title, "description": description, "ok": bool(title)}
+
+    async def preview(self, url):
+        """リンク先の情報（キャッシュがあれば通信しない）。取得できなければ None"""
+        info = self.cache.get(url)
+        if info is not None:
+            self.cache_hits += 1
+            return info if info["ok"] else None
+        # 同じURLが同時に要求されたら1回の取得を共有する
+        if url not in self._inflight:
+            self._inflight[url] = asyncio.ensure_future(self._preview_uncached(url))
+        return await asyncio.shield(self._inflight[url])
+
+    async def _preview_uncached(self, url):
+        async with self._slots:
+            try:
+                info = await self._fetch(url)
+                self.fetched += 1
+            except httpx.PoolTimeout as e:
+                # 接続プールの空き待ち（こちら側の混雑）はリンク先の失敗として記録しない
+                self.failures += 1
+                print(f"  ⚠️ リンクを取得できません: {url} ({type(e).__name__})")
+                return None
+            except (httpx.HTTPError, httpx.InvalidURL, asyncio.TimeoutError, ValueError) as e:
+                self.failures += 1
+                print(f"  ⚠️ リンクを取得できません: {url} ({type(e).__name__})")
+                info = {"url": None, "title": "", "description": "", "ok": False}
+        self.cache.put(url, info)
+        return info if info["ok"] else None
+
+    async def enrich(self, tweets):
+        """本文にURLを含むツイートに links（[{"url","title","description"}]）を追加し、追加した件数を返す"""
+        urls_by_tweet = [extract_urls(t["text"]) for t in tweets]
+        unique = list(dict.fromkeys(url for urls in urls_by_tweet for url in urls))
+        results = dict(zip(unique, await asyncio.gather(*(self.preview(url) for url in unique))))
+        enriched = 0
+        for t, urls in zip(tweets, urls_by_tweet):
+            links = [results[url] for url in urls if results.get(url)]
+            if links:
+                t["links"] = [{k: link[k] for k in ("url", "title", "description")} for link in links]
+                enriched += 1
+        return enriched
@@ -0,0 +1,101 @@
+"""
+要約メールの送信（複数の宛先に1つのSMTP接続を使い回して送る）
+
+宛先ごとに接続・ログインし直すと、N通の送信にN回のハンドシェイク（TLS＋認証）がかかる。
+MailSession は1回ログインした接続で続けて送信し、1接続あたりの通数が batch_size に
+達したら接続し直す（Gmail は1接続で大量に送ると切断するため）。
+途中で切断された場合は自動で再接続し、その1通だけ送り直す。
+SSLを使わない設定（587番ポートなど）では STARTTLS で暗号化してからログインする。
+"""
+import smtplib
+import ssl
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+
+def build_message(summary, sender, to, subject):
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = subject
+    msg["From"] = sender
+    msg["To"] = to
+    msg.attach(MIMEText(summary, "plain", "utf-8"))
+    return msg
+
+
+def connect(host, port, user, password, use_ssl=True, allow_plaintext=False, timeout=60):
+    """ログイン済みのSMTP接続を返す
+
+    use_ssl が False なら STARTTLS で暗号化してからログインする。サーバーが STARTTLS に
+    対応していない場合は、allow_plaintext（ローカルのテスト用サーバーなど）のときだけ暗号化せずに続ける。
+    """
+    if use_ssl:
+        server = smtplib.SMTP_SSL(host, port, timeout=timeout, context=ssl.create_default_context())
+    else:
+        server = smtplib.SMTP(host, port, timeout=timeout)
+    try:
+        if not use_ssl:
+            server.ehlo()
+            if server.has_extn("starttls") or not allow_plaintext:
+                server.starttls(context=ssl.create_default_context())
+                server.ehlo()
+        server.login(user, password)
+    except BaseException:
+        server.close()
+        raise
+    return server
+
+
+class MailSession:
+    """ログイン済みのSMTP接続を複数通の送信で使い回す"""
+
+    def __init__(self, host, port, user, password, use_ssl=True, batch_size=50, timeout=60,
+                 allow_plaintext=False):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.use_ssl = use_ssl
+        self.allow_plaintext = allow_plaintext
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.server = None
+        self.connects = 0
+        self.sent = 0
+        self._sent_on_connection = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _connect(self):
+        self.close()
+        self.server = connect(self.host, self.port, self.user, self.password,
+                              self.use_ssl, self.allow_plaintext, self.timeout)
+        self.connects += 1
+        self._sent_on_connection = 0
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except (smtplib.SMTPException, OSError):
+            self.server.close()
+        self.server = None
+
+    def send(self, msg):
+        """1通送信（接続がなければ接続、batch_size 通ごとに接続し直す）"""
+        if self.server is None or self._sent_on_connection >= self.batch_size:
+            self._connect()
+        try:
+            self.server.send_message(msg)
+        except (smtplib.SMTPServerDisconnected, smtplib.SMTPResponseException) as e:
+            # アイドル切断や 421（接続あたりの上限）なら、つなぎ直して1回だけ送り直す
+            if isinstance(e, smtplib.SMTPResponseException) and e.smtp_code != 421:
+                raise
+            self._connect()
+            self.server.send_message(msg)
+        self._sent_on_connection += 1
+        self.sent += 1
@@ -4,81 +4,415 @@ Xリスト自動要約→Gmail送信システム v3 (twikit + Gemini + Web設定
 使い方:
 1. 設定画面を開く.bat をダブルクリック → ブラウザで設定を入力
 2. main.py を実行（手動 or タスクスケジューラ）
+
+起動を速くするため、twikit・google-genai・smtplib などの重いライブラリは
+それを使う段階で初めてインポートする（送信済みの日は読み込まずに終了できる）。
 """
-import asyncio
-import json
-import smtplib
-import sys
 import io
 import os
-import time
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from datetime import datetime
-from twikit import Client
+import sys
+from datetime import datetime, timedelta, timezone
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 LAST_RUN_FILE = os.path.join(SCRIPT_DIR, ".last_run")
-SETTINGS_FILE = os.path.join(SCRIPT_DIR, "settings.json")
+WATERMARK_FILE = os.path.join(SCRIPT_DIR, ".watermark.json")
+OUTPUT_DIR = os.path.join(SCRIPT_DIR, "output")
+OUTBOX_DIR = os.path.join(SCRIPT_DIR, "outbox")
+CHECKPOINT_DIR = os.path.join(SCRIPT_DIR, "checkpoints")
 
 # Windows文字化け対策
 if sys.platform == 'win32':
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
-    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', line_buffering=True)
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', line_buffering=True)
+
+
+def already_sent_today():
+    """今日すでに送信済みかチェック"""
+    today = datetime.now().strftime("%Y-%m-%d")
+    if os.path.exists(LAST_RUN_FILE):
+        with open(LAST_RUN_FILE, "r") as f:
+            return f.read().strip() == today
+    return False
+
+
+def outbox_pending():
+    """送信待ちの要約があればTrue（ファイル名だけを見る軽い判定）"""
+    return os.path.isdir(OUTBOX_DIR) and any(name.endswith(".json") for name in os.listdir(OUTBOX_DIR))
+
+
+# --skip-if-sent: 送信済みの日は asyncio なども読み込まずにすぐ終了する（タスクスケジューラの再実行用）
+# 送信待ちの要約が残っている場合は、再送のために通常どおり起動する
+if __name__ == "__main__" and "--skip-if-sent" in sys.argv[1:] \
+        and not {"--offline", "--daemon", "--drain", "--incremental"} & set(sys.argv[1:]) \
+        and already_sent_today() and not outbox_pending():
+    print("📬 本日はすでに送信済みです。スキップします。")
+    sys.exit(0)
+
+import argparse  # noqa: E402
+import asyncio  # noqa: E402
+import json  # noqa: E402
+import time  # noqa: E402
+from concurrent.futures import ProcessPoolExecutor  # noqa: E402
+from concurrent.futures.process import BrokenProcessPool  # noqa: E402
+import checkpoint  # noqa: E402
+from jsonfile import write_atomic  # noqa: E402
+import metrics  # noqa: E402
+import outbox  # noqa: E402
+import rate_limit  # noqa: E402
+import settings_store  # noqa: E402
+from preprocess import (  # noqa: E402
+    analyze_batch, collapse_duplicates, compact_tweets, estimate_tokens, format_batch, reference_time,
+)
+from retry import retry_async  # noqa: E402
+from summary_cache import SummaryCache, make_key  # noqa: E402
+from tweet_store import TweetRecord, TweetStore  # noqa: E402
 
 
 # --- 設定読み込み ---
 
 def _load_settings():
     """settings.json から設定を読み込む"""
-    if not os.path.exists(SETTINGS_FILE):
+    if not settings_store.exists():
         print("❌ settings.json が見つかりません。")
         print("   「設定画面を開く.bat」で設定を行ってください。")
         sys.exit(1)
-    with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+    try:
+        return settings_store.load_settings()
+    except (settings_store.SettingsError, ValueError) as e:
+        print(f"❌ {e}")
+        print("   「設定画面を開く.bat」で設定を確認してください。")
+        sys.exit(1)
+
+
+def _list_id(url):
+    """リストURL（またはID）からリストIDを取り出す"""
+    return url.strip().rstrip('/').split('/')[-1]
 
-_settings = _load_settings()
-LIST_URL = _settings["list_url"]
-GEMINI_API_KEY = _settings["gemini_api_key"]
-GMAIL_USER = _settings["gmail_user"]
-GMAIL_APP_PASSWORD = _settings["gmail_app_password"]
-LIST_ID = LIST_URL.split('/')[-1]
-X_COOKIES = _settings.get("x_cookies", {})
 
+def _apply_settings(settings):
+    """設定値をモジュール定数に反映（デーモンモードでは変更時に再適用）"""
+    global GEMINI_API_KEY, GMAIL_USER, GMAIL_APP_PASSWORD, LIST_URLS, LIST_IDS, X_COOKIES
+    global MAX_PAGES, FIRST_RUN_HOURS, FETCH_CONCURRENCY, FETCH_TIMEOUT, STORE_RETENTION_DAYS
+    global SUMMARY_CHUNK_TOKENS, SUMMARY_CONCURRENCY, SUMMARY_CACHE_ENTRIES, SUMMARY_CACHE_DAYS
+    global SCHEDULE_TIME, RETRY_ATTEMPTS, RETRY_MAX_DELAY, STREAM_SUMMARY, DEDUPE_THRESHOLD
+    global PROMPT_TOKEN_BUDGET, SMTP_HOST, SMTP_PORT, SMTP_SSL, SMTP_ALLOW_PLAINTEXT, SMTP_BATCH_SIZE, RECIPIENTS
+    global INCREMENTAL_HOURS, PREPROCESS_WORKERS, ENRICH_LINKS, LINK_CONCURRENCY, LINK_TIMEOUT, LINK_CACHE_DAYS
+    global SUMMARY_BATCH_TOKENS
+    GEMINI_API_KEY = settings["gemini_api_key"]
+    GMAIL_USER = settings["gmail_user"]
+    GMAIL_APP_PASSWORD = settings["gmail_app_password"]
+    LIST_URLS = settings["list_urls"]
+    LIST_IDS = [_list_id(url) for url in LIST_URLS if url.strip()]
+    X_COOKIES = settings["x_cookies"]
+    MAX_PAGES = settings["max_pages"]
+    FIRST_RUN_HOURS = settings["first_run_hours"]
+    FETCH_CONCURRENCY = settings["fetch_concurrency"]
+    FETCH_TIMEOUT = settings["fetch_timeout"]
+    STORE_RETENTION_DAYS = settings["store_retention_days"]
+    SUMMARY_CHUNK_TOKENS = settings["summary_chunk_tokens"]
+    SUMMARY_CONCURRENCY = settings["summary_concurrency"]
+    SUMMARY_CACHE_ENTRIES = settings["summary_cache_entries"]
+    SUMMARY_CACHE_DAYS = settings["summary_cache_days"]
+    SCHEDULE_TIME = settings["schedule_time"]
+    RETRY_ATTEMPTS = settings["retry_attempts"]
+    RETRY_MAX_DELAY = float(settings["retry_max_delay"])
+    STREAM_SUMMARY = settings["stream_summary"]
+    DEDUPE_THRESHOLD = float(settings["dedupe_threshold"])
+    PROMPT_TOKEN_BUDGET = settings["prompt_token_budget"]
+    SMTP_HOST = settings["smtp_host"]
+    SMTP_PORT = settings["smtp_port"]
+    SMTP_SSL = settings["smtp_ssl"]
+    SMTP_ALLOW_PLAINTEXT = settings["smtp_allow_plaintext"]
+    SMTP_BATCH_SIZE = settings["smtp_batch_size"]
+    RECIPIENTS = settings["recipients"]
+    INCREMENTAL_HOURS = settings["incremental_hours"]
+    PREPROCESS_WORKERS = settings["preprocess_workers"] or os.cpu_count() or 1
+    ENRICH_LINKS = settings["enrich_links"]
+    LINK_CONCURRENCY = settings["link_concurrency"]
+    LINK_TIMEOUT = settings["link_timeout"]
+    LINK_CACHE_DAYS = settings["link_cache_days"]
+    SUMMARY_BATCH_TOKENS = settings["summary_batch_tokens"]
 
-async def fetch_x_list():
-    """twikit経由でXリストからツイートを取得"""
-    print(f"[1/3] Xリスト取得中... (List ID: {LIST_ID})")
 
+# 初期値（settings.json は main() で読み込む）
+_apply_settings(settings_store.DEFAULTS)
+
+TWEET_SEPARATOR = "\n"
+
+
+# --- クライアント ---
+
+def make_x_client():
+    """Cookie設定済みのtwikitクライアントを作成（X のレート制限に合わせて間隔を調整）"""
+    from twikit import Client
     client = Client('ja-JP')
     client.set_cookies(X_COOKIES)
+    return rate_limit.shared().attach(client)
 
-    tweets = await client.get_list_tweets(LIST_ID)
-    count = len(tweets)
-    print(f"  → {count}件のツイートを取得")
 
-    formatted = []
-    for tweet in tweets:
-        user = tweet.user.screen_name
-        text = tweet.text
-        time_str = tweet.created_at
-        formatted.append(f"【@{user}】({time_str})\n{text}")
+def make_gemini_client():
+    """Geminiクライアントを作成"""
+    from google import genai
+    return genai.Client(api_key=GEMINI_API_KEY)
 
-    return "\n\n---\n\n".join(formatted)
 
+async def _retry(func, *args, label="", **kwargs):
+    """設定のリトライ回数・最大待機時間で retry_async を呼ぶ"""
+    return await retry_async(
+        func, *args, label=label, attempts=RETRY_ATTEMPTS, max_delay=RETRY_MAX_DELAY, **kwargs
+    )
 
-def summarize_with_gemini(raw_text, max_retries=3):
-    """Gemini APIでツイートを要約（リトライ付き）"""
-    print("[2/3] Gemini APIで要約中...")
-    from google import genai
 
-    client = genai.Client(api_key=GEMINI_API_KEY)
+# --- 取得済み位置（ハイウォーターマーク） ---
+
+def load_watermarks():
+    """リストIDごとの送信済み最新ツイート位置を読み込む（読めなければ未記録として扱う）"""
+    if not os.path.exists(WATERMARK_FILE):
+        return {}
+    try:
+        with open(WATERMARK_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError("オブジェクトではありません")
+        return data
+    except (OSError, ValueError) as e:
+        print(f"  ⚠️ {os.path.basename(WATERMARK_FILE)} を読み込めないため、取得位置は未記録として扱います: {e}")
+        return {}
+
+
+def save_watermarks(new_marks):
+    """送信成功後に最新ツイート位置を記録（途中で落ちても壊れないよう一時ファイルから置き換え）"""
+    data = load_watermarks()
+    data.update(new_marks)
+    write_atomic(WATERMARK_FILE, data, indent=4)
+
+
+def window_starts(marks, list_ids):
+    """リストごとの要約対象期間の開始時刻 {リストID: UNIX秒}。未記録のリストは直近 FIRST_RUN_HOURS 時間"""
+    first_run = datetime.now(timezone.utc) - timedelta(hours=FIRST_RUN_HOURS)
+    starts = {}
+    for list_id in list_ids:
+        mark = marks.get(list_id)
+        if mark:
+            starts[list_id] = datetime.strptime(mark["last_created_at"], "%a %b %d %H:%M:%S %z %Y").timestamp()
+        else:
+            starts[list_id] = first_run.timestamp()
+    return starts
+
+
+def window_start(marks, list_ids):
+    """要約対象期間の最も古い開始時刻 (UNIX秒)。表示用（読み出しはリストごとの window_starts を使う）"""
+    return min(window_starts(marks, list_ids).values(),
+               default=(datetime.now(timezone.utc) - timedelta(hours=FIRST_RUN_HOURS)).timestamp())
+
+
+async def fetch_x_list(client, list_id, mark):
+    """twikit経由でXリストから前回以降の新着ツイートを取得（カーソルでページ送り）
+
+    戻り値: (TweetRecord のリスト, 新しいウォーターマーク or None)
+    各ページは読んだそばから TweetRecord に変換し、twikit のオブジェクトは保持しない。
+    """
+    last_id = int(mark["last_id"]) if mark else 0
+    # 初回は直近 FIRST_RUN_HOURS 時間分だけを対象にする
+    cutoff = None if mark else datetime.now(timezone.utc) - timedelta(hours=FIRST_RUN_HOURS)
+
+    tweets = []
+    page = await _retry(client.get_list_tweets, list_id, label=f"List {list_id}")
+    pages = 1
+    metrics.count("pages")
+    crossed = False
+    while True:
+        for tweet in page:
+            if int(tweet.id) <= last_id or (cutoff and tweet.created_at_datetime < cutoff):
+                crossed = True
+                break
+            tweets.append(TweetRecord.from_twikit(tweet))
+        if crossed or len(page) == 0 or pages >= MAX_PAGES:
+            break
+        page = await _retry(page.next, label=f"List {list_id}")
+        pages += 1
+        metrics.count("pages")
+
+    print(f"  → List {list_id}: {len(tweets)}件の新着ツイートを取得 ({pages}ページ)")
+    if pages >= MAX_PAGES and not crossed:
+        print(f"  ⚠️ List {list_id}: 最大ページ数({MAX_PAGES})に達したため、それ以前の投稿は取得していません")
+    if not tweets:
+        return [], None
+
+    newest = max(tweets, key=lambda t: t.id)
+    created_at = datetime.fromtimestamp(newest.created_at, timezone.utc).strftime("%a %b %d %H:%M:%S %z %Y")
+    return tweets, {"last_id": str(newest.id), "last_created_at": created_at}
+
+
+async def fetch_all_lists(store, marks, client=None):
+    """全リストを同時実行数の上限つきで並行取得し、ツイートストアに保存
+
+    戻り値: {リストID: 新しいウォーターマーク}
+    """
+    if not LIST_IDS:
+        raise RuntimeError("リストURLが設定されていません")
+    print(f"[1/3] Xリスト取得中... ({len(LIST_IDS)}リスト, 同時{FETCH_CONCURRENCY}件まで)")
+
+    client = client or make_x_client()
+    semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+    limiter = rate_limit.shared()
+    waited = limiter.wait_seconds
+
+    async def fetch_one(list_id):
+        async with semaphore:
+            # レート制限に合わせた待機はタイムアウトに数えない
+            return await rate_limit.wait_for(
+                fetch_x_list(client, list_id, marks.get(list_id)),
+                timeout=FETCH_TIMEOUT
+            )
+
+    results = await asyncio.gather(
+        *(fetch_one(list_id) for list_id in LIST_IDS), return_exceptions=True
+    )
+    limiter.save()
+    if limiter.wait_seconds > waited:
+        metrics.count("rate_limit_wait_seconds", limiter.wait_seconds - waited)
+
+    new_marks = {}
+    added = 0
+    for list_id, result in zip(LIST_IDS, results):
+        if isinstance(result, BaseException):
+            reason = "タイムアウト" if isinstance(result, asyncio.TimeoutError) else f"{type(result).__name__}: {result}"
+            print(f"  ❌ List {list_id} の取得に失敗: {reason}")
+            metrics.count("lists_failed")
+            continue
+        tweets, new_mark = result
+        if new_mark:
+            new_marks[list_id] = new_mark
+        added += store.add_tweets(list_id, tweets)
+        metrics.count("tweets_fetched", len(tweets))
+    metrics.count("tweets_new", added)
+
+    if all(isinstance(r, BaseException) for r in results):
+        raise RuntimeError("すべてのリストの取得に失敗しました")
+
+    print(f"  → 新規{added}件をツイートストアに保存")
+    return new_marks
+
+
+# --- 前処理 ---
+
+PARALLEL_MIN_TWEETS = 2000  # これ未満はプロセスを起動するより1プロセスで処理したほうが速い
+_pool = None
+_pool_workers = 0
 
-    today = datetime.now().strftime("%Y年%m月%d日")
-    prompt = f"""あなたはAI・テクノロジー業界の情報アナリストです。
+
+def _preprocess_pool():
+    """前処理用のプロセスプール（常駐モードでは使い回す。1ワーカーの設定なら None）"""
+    global _pool, _pool_workers
+    if PREPROCESS_WORKERS <= 1:
+        return None
+    if _pool is not None and _pool_workers != PREPROCESS_WORKERS:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PREPROCESS_WORKERS)
+        _pool_workers = PREPROCESS_WORKERS
+    return _pool
+
+
+async def _map_batches(func, items, *args):
+    """items をバッチに分けてプロセスプールで func(batch, *args) を実行し、結果を元の順で返す
+
+    終わったバッチから順に受け取るため、待っている間もイベントループは取得などの通信を進められる。
+    件数が少ないときやプールが使えないときは、別スレッドでまとめて実行する。
+    """
+    global _pool
+    pool = _preprocess_pool() if len(items) >= PARALLEL_MIN_TWEETS else None
+    if pool is None:
+        return await asyncio.to_thread(func, items, *args)
+
+    loop = asyncio.get_running_loop()
+    # ワーカーあたり4バッチ程度に分け、処理の重いバッチがあっても偏らないようにする
+    size = max(PARALLEL_MIN_TWEETS // 4, -(-len(items) // (PREPROCESS_WORKERS * 4)))
+
+    async def run(start):
+        return start, await loop.run_in_executor(pool, func, items[start:start + size], *args)
+
+    results = [None] * len(items)
+    try:
+        for done in asyncio.as_completed([run(start) for start in range(0, len(items), size)]):
+            start, batch = await done
+            results[start:start + len(batch)] = batch
+            metrics.count("pool_batches")
+    except BrokenProcessPool:
+        print("  ⚠️ 前処理のワーカープロセスが異常終了したため、1プロセスで処理します")
+        _pool = None
+        return await asyncio.to_thread(func, items, *args)
+    return results
+
+
+async def enrich_links(tweets):
+    """リンク先のタイトル・概要を tweets に追加（httpx は使うときだけ読み込む）"""
+    import link_preview
+    cache = link_preview.LinkCache(ttl_days=LINK_CACHE_DAYS)
+    try:
+        async with link_preview.LinkPreviewer(cache, LINK_CONCURRENCY, timeout=LINK_TIMEOUT) as previewer:
+            enriched = await previewer.enrich(tweets)
+        cache.prune()
+    finally:
+        cache.close()
+    metrics.count("links_fetched", previewer.fetched)
+    metrics.count("link_cache_hits", previewer.cache_hits)
+    metrics.count("link_failures", previewer.failures)
+    print(f"  → リンク展開: {enriched}件に追加"
+          f"（取得{previewer.fetched}件 / キャッシュ{previewer.cache_hits}件 / 失敗{previewer.failures}件）")
+
+
+async def preprocess_tweets(rows):
+    """重複をまとめ、トークン予算に収まるよう短く整形したプロンプト用の行を返す
+
+    1件ずつの処理（fingerprint・言語判定・整形・優先度）はプロセスプールで並列に行い、
+    全体を見る必要がある重複の集約と予算内の選択だけをこのプロセスで行う。
+    """
+    tweets = [dict(row) for row in rows]
+    analyzed = await _map_batches(analyze_batch, tweets)
+    languages = {}
+    for t, (_, lang, _) in zip(tweets, analyzed):
+        t["lang"] = lang
+        languages[lang] = languages.get(lang, 0) + 1
+    before = sum(tokens for _, _, tokens in analyzed)
+
+    collapsed = await asyncio.to_thread(
+        collapse_duplicates, tweets, DEDUPE_THRESHOLD, [fp for fp, _, _ in analyzed]
+    )
+    lang_text = ", ".join(f"{lang} {n}" for lang, n in sorted(languages.items(), key=lambda kv: -kv[1]))
+    print(f"  → 重複集約: {len(tweets)}件 → {len(collapsed)}件（言語: {lang_text}）")
+
+    if ENRICH_LINKS and collapsed:
+        try:
+            await enrich_links(collapsed)
+        except Exception as e:
+            # リンクの展開は補助的な情報なので、失敗しても本文だけで要約を続ける
+            print(f"  ⚠️ リンクの展開に失敗しました: {type(e).__name__}: {e}")
+
+    formatted = await _map_batches(format_batch, collapsed, reference_time(collapsed)) if collapsed else []
+    entries = compact_tweets(collapsed, PROMPT_TOKEN_BUDGET, formatted)
+    after = sum(estimate_tokens(e) for e in entries)
+    dropped = len(collapsed) - len(entries)
+    metrics.count("tweets_in", len(tweets))
+    metrics.count("tweets_collapsed", len(collapsed))
+    metrics.count("prompt_lines", len(entries))
+    metrics.count("tokens_before", before)
+    metrics.count("tokens_after", after)
+    for lang, n in languages.items():
+        metrics.count(f"lang_{lang}", n)
+    note = f"、予算超過で{dropped}件を除外" if dropped else ""
+    print(f"  → プロンプト圧縮: 推定トークン {before} → {after} (予算 {PROMPT_TOKEN_BUDGET}{note})")
+    return entries
+
+
+GEMINI_MODEL = 'gemini-2.5-flash'
+
+SUMMARY_PROMPT = """あなたはAI・テクノロジー業界の情報アナリストです。
 
 以下はX(Twitter)のAI関連リストから取得した本日({today})の投稿です。
+（1行1投稿。「@ユーザー(時間)」の時間は最新の投稿からの経過、［N件共有］は同じ内容を投稿・リツイートしたアカウント数、🔗はリンク、🔗「」はリンク先の記事のタイトルと概要）
 
 【タスク】
 1. 重要なトピックを抽出してください
@@ -96,51 +430,513 @@ def summarize_with_gemini(raw_text, max_retries=3):
 
 {raw_text}"""
 
-    for attempt in range(max_retries):
+# 分割要約 (map) 用: 投稿の一部から話題を漏れなく抜き出す
+CHUNK_PROMPT = """あなたはAI・テクノロジー業界の情報アナリストです。
+
+以下はX(Twitter)のAI関連リストから取得した本日({today})の投稿の一部（{index}/{total}）です。
+（1行1投稿。「@ユーザー(時間)」の時間は最新の投稿からの経過、［N件共有］は同じ内容を投稿・リツイートしたアカウント数、🔗はリンク、🔗「」はリンク先の記事のタイトルと概要）
+後で他の部分と統合するため、重要なトピックを箇条書きで漏れなく抽出してください。
+各トピックには関連するアカウント名(@user)と、言及数が多い場合はその旨を添えてください。
+
+---
+
+{raw_text}"""
+
+# 途中経過用: 日中に取得した分だけを先に要点抽出しておく
+PARTIAL_PROMPT = """あなたはAI・テクノロジー業界の情報アナリストです。
+
+以下はX(Twitter)のAI関連リストから取得した、本日({today}) {start}〜{end} の投稿です。
+（1行1投稿。「@ユーザー(時間)」の時間は最新の投稿からの経過、［N件共有］は同じ内容を投稿・リツイートしたアカウント数、🔗はリンク、🔗「」はリンク先の記事のタイトルと概要）
+後で1日分をまとめるため、重要なトピックを箇条書きで漏れなく抽出してください。
+各トピックには関連するアカウント名(@user)と、言及数が多い場合はその旨を添えてください。
+
+---
+
+{raw_text}"""
+
+# 統合 (reduce) 用: 部分要約を最終レイアウトにまとめる
+MERGE_PROMPT = """あなたはAI・テクノロジー業界の情報アナリストです。
+
+以下はX(Twitter)のAI関連リストから取得した本日({today})の投稿を、分割して要点抽出したものです。
+
+【タスク】
+1. すべての部分から重要なトピックを選んでください
+2. 以下のカテゴリで整理してください：
+   - 🤖 AI新モデル・技術発表
+   - 📊 業界動向・ニュース
+   - 💡 活用事例・Tips
+   - 🏢 企業動向・資金調達
+   - 📌 その他注目情報
+3. 各項目は簡潔に2-3行でまとめてください
+4. 部分をまたいで重複する話題は統合してください
+5. 最後に「本日の注目ポイント」を1-2文で
+
+---
+
+{raw_text}"""
+
+
+# 一括要約用: 複数のグループの要約を1回のリクエストで作り、JSON（依頼ごとに1オブジェクト）で受け取る
+BATCH_PROMPT = """あなたはAI・テクノロジー業界の情報アナリストです。
+
+以下はX(Twitter)のAI関連リストから取得した本日({today})の投稿を、要約の送り先ごとに分けた{count}件の要約依頼です。
+（1行1投稿。「@ユーザー(時間)」の時間は最新の投稿からの経過、［N件共有］は同じ内容を投稿・リツイートしたアカウント数、🔗はリンク、🔗「」はリンク先の記事のタイトルと概要）
+
+【タスク】
+依頼ごとに、その依頼の投稿だけを使って（他の依頼の投稿は混ぜずに）次の内容を作成してください。
+1. 重要なトピックを抽出し、以下のカテゴリの項目に整理してください（該当がなければ空の配列）：
+{categories}
+2. 各項目は簡潔に2-3行でまとめてください
+3. 重複する話題は統合してください
+4. highlight には「本日の注目ポイント」を1-2文で
+
+依頼ごとに1つのオブジェクトを返し、job_id には依頼のIDをそのまま入れてください。
+
+{jobs}"""
+
+# 一括要約の各カテゴリ: (JSONのフィールド名, 見出し)
+SUMMARY_CATEGORIES = [
+    ("models", "🤖 AI新モデル・技術発表"),
+    ("industry", "📊 業界動向・ニュース"),
+    ("tips", "💡 活用事例・Tips"),
+    ("business", "🏢 企業動向・資金調達"),
+    ("others", "📌 その他注目情報"),
+]
+
+BATCH_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "job_id": {"type": "STRING"},
+            **{field: {"type": "ARRAY", "items": {"type": "STRING"}} for field, _ in SUMMARY_CATEGORIES},
+            "highlight": {"type": "STRING"},
+        },
+        "required": ["job_id", *(field for field, _ in SUMMARY_CATEGORIES), "highlight"],
+    },
+}
+
+# ストリーミングが途中で切れたときに要約の末尾に付ける注記
+TRUNCATED_NOTE = "\n\n（※ 生成が途中で中断されたため、要約は途中までです）"
+
+
+def split_into_chunks(entries, budget):
+    """整形済みツイートをトークン予算ごとのまとまりに分割"""
+    chunks = []
+    current = []
+    used = 0
+    for entry in entries:
+        tokens = estimate_tokens(entry)
+        if current and used + tokens > budget:
+            chunks.append(current)
+            current = []
+            used = 0
+        current.append(entry)
+        used += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _count_tokens(prompt, text, usage=None):
+    """プロンプト・応答のトークン数を計測値に加算（usage_metadata がなければ推定値）"""
+    metrics.count("gemini_calls")
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    response_tokens = getattr(usage, "candidates_token_count", None)
+    metrics.count("prompt_tokens", prompt_tokens if prompt_tokens is not None else estimate_tokens(prompt))
+    metrics.count("response_tokens", response_tokens if response_tokens is not None else estimate_tokens(text or ""))
+
+
+async def _generate(client, prompt, label, stream=False, config=None, output_suffix=""):
+    """generate_content を1回分実行（一時的なエラーならそのリクエストだけリトライ）"""
+    if stream:
+        return await _generate_stream(client, prompt, label, output_suffix)
+    kwargs = {"config": config} if config else {}
+    response = await _retry(
+        client.aio.models.generate_content, model=GEMINI_MODEL, contents=prompt, label=label, **kwargs
+    )
+    _count_tokens(prompt, response.text, getattr(response, "usage_metadata", None))
+    return response.text
+
+
+async def _generate_stream(client, prompt, label, output_suffix=""):
+    """ストリーミングで生成し、受け取った分からコンソールと output/ のファイルに書き出す
+
+    途中で接続が切れた場合はリトライし、それでも失敗したら
+    受信できたところまでの要約を使う（.partial ファイルにも残す）。
+    output_suffix: ファイル名の日付の後ろに付ける文字列（宛先グループごとに別のファイルにする）
+    """
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    path = os.path.join(OUTPUT_DIR, f"summary_{datetime.now().strftime('%Y%m%d')}{output_suffix}.txt")
+    partial_path = path + ".partial"
+    longest = ""
+    usage = None
+
+    async def attempt():
+        nonlocal longest, usage
+        parts = []
         try:
-            response = client.models.generate_content(
-                model='gemini-2.5-flash',
-                contents=prompt
-            )
-            print("  → 要約完了")
-            return response.text
-        except Exception as e:
-            if '429' in str(e) and attempt < max_retries - 1:
-                wait = 30 * (attempt + 1)
-                print(f"  ⏳ レート制限。{wait}秒待機してリトライ... ({attempt+1}/{max_retries})")
-                time.sleep(wait)
-            else:
-                raise
+            with open(partial_path, "w", encoding="utf-8") as f:
+                async for chunk in await client.aio.models.generate_content_stream(
+                    model=GEMINI_MODEL,
+                    contents=prompt
+                ):
+                    text = chunk.text or ""
+                    usage = getattr(chunk, "usage_metadata", None) or usage
+                    parts.append(text)
+                    f.write(text)
+                    f.flush()
+                    print(text, end="", flush=True)
+        finally:
+            received = "".join(parts)
+            if len(received) > len(longest):
+                longest = received
+            if parts:
+                print()
+        return received
 
-    return None
+    try:
+        summary = await _retry(attempt, label=label)
+    except Exception as e:
+        if not longest:
+            raise
+        with open(partial_path, "w", encoding="utf-8") as f:
+            f.write(longest)
+        print(f"  ⚠️ 生成が途中で中断されました ({type(e).__name__})。途中までの要約を使用します: {partial_path}")
+        _count_tokens(prompt, longest, usage)
+        metrics.count("truncated")
+        return longest + TRUNCATED_NOTE
 
+    _count_tokens(prompt, summary, usage)
+    os.replace(partial_path, path)
+    print(f"  → 要約を保存: {path}")
+    return summary
 
-def send_email(summary):
-    """Gmailで要約を送信"""
-    print("[3/3] メール送信中...")
-    today = datetime.now().strftime("%Y/%m/%d")
 
-    msg = MIMEMultipart("alternative")
-    msg["Subject"] = f"📰 Xリスト AI要約 ({today})"
-    msg["From"] = GMAIL_USER
-    msg["To"] = GMAIL_USER
+def _summary_cache_key(entries, today, earlier=()):
+    # 一括要約の結果も同じキーで保存するため、一括用のプロンプト・スキーマ・カテゴリもキーに含める
+    prompts = "\0".join([
+        SUMMARY_PROMPT, CHUNK_PROMPT, MERGE_PROMPT, BATCH_PROMPT,
+        json.dumps(BATCH_SCHEMA, ensure_ascii=False, sort_keys=True),
+        json.dumps(SUMMARY_CATEGORIES, ensure_ascii=False),
+    ])
+    return make_key(
+        entries, prompts, GEMINI_MODEL,
+        extra=f"{today}|{SUMMARY_CHUNK_TOKENS}|" + "\0".join(earlier)
+    )
 
-    msg.attach(MIMEText(summary, "plain", "utf-8"))
 
-    with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-        server.login(GMAIL_USER, GMAIL_APP_PASSWORD)
-        server.send_message(msg)
+async def summarize_with_gemini(entries, client=None, earlier=(), output_suffix=""):
+    """Gemini APIでツイートを要約（リトライ付き）
 
-    print(f"  → {GMAIL_USER} に送信完了！")
+    トークン数が SUMMARY_CHUNK_TOKENS を超える場合は分割して並行要約し、
+    最後に1回の統合リクエストでカテゴリ別の要約にまとめる。
+    earlier: 日中に作成済みの部分要約。あればその後の投稿だけを要点抽出して統合する。
+    output_suffix: ストリーミング時の出力ファイル名に付ける文字列
+    """
+    print("[2/3] Gemini APIで要約中...")
+    today = datetime.now().strftime("%Y年%m月%d日")
 
+    cache = SummaryCache(max_entries=SUMMARY_CACHE_ENTRIES, max_age_days=SUMMARY_CACHE_DAYS)
+    cache_key = _summary_cache_key(entries, today, earlier)
+    summary = cache.get(cache_key)
+    if summary is None:
+        summary = await _summarize(entries, today, client or make_gemini_client(), earlier, output_suffix)
+        if summary and not summary.endswith(TRUNCATED_NOTE):
+            cache.put(cache_key, summary)
+    else:
+        print("  → キャッシュ済みの要約を使用（Gemini呼び出しなし）")
+        metrics.count("cache_hits")
+    print(f"  → 要約キャッシュ: {cache.stats()}")
+    return summary
 
-def already_sent_today():
-    """今日すでに送信済みかチェック"""
-    today = datetime.now().strftime("%Y-%m-%d")
-    if os.path.exists(LAST_RUN_FILE):
-        with open(LAST_RUN_FILE, "r") as f:
-            return f.read().strip() == today
-    return False
+
+async def _summarize(entries, today, client, earlier=(), output_suffix=""):
+    chunks = split_into_chunks(entries, SUMMARY_CHUNK_TOKENS)
+    if not earlier and len(chunks) <= 1:
+        prompt = SUMMARY_PROMPT.format(today=today, raw_text=TWEET_SEPARATOR.join(entries))
+        summary = await _generate(client, prompt, "要約", stream=STREAM_SUMMARY, output_suffix=output_suffix)
+        print("  → 要約完了")
+        return summary
+
+    if earlier:
+        print(f"  → 途中経過の要約{len(earlier)}件と、その後の投稿{len(entries)}件を統合します")
+    else:
+        print(f"  → {len(chunks)}分割で要約します（同時{SUMMARY_CONCURRENCY}件まで）")
+    semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+
+    async def summarize_chunk(index, chunk):
+        prompt = CHUNK_PROMPT.format(
+            today=today, index=index, total=len(chunks), raw_text=TWEET_SEPARATOR.join(chunk)
+        )
+        async with semaphore:
+            partial = await _generate(client, prompt, f"分割{index}")
+        print(f"  → 分割{index}/{len(chunks)} 完了")
+        return partial
+
+    partials = list(earlier) + await asyncio.gather(
+        *(summarize_chunk(i, chunk) for i, chunk in enumerate(chunks, 1))
+    )
+
+    merged = "\n\n===\n\n".join(
+        f"【部分{i}】\n{partial}" for i, partial in enumerate(partials, 1) if partial
+    )
+    summary = await _generate(client, MERGE_PROMPT.format(today=today, raw_text=merged), "統合",
+                              stream=STREAM_SUMMARY, output_suffix=output_suffix)
+    print("  → 要約完了")
+    return summary
+
+
+# --- 一括要約 ---
+
+def render_digest(item):
+    """一括要約の1オブジェクトを、通常の要約と同じカテゴリ別のテキストにする"""
+    sections = []
+    for field, heading in SUMMARY_CATEGORIES:
+        if item[field]:
+            sections.append(heading + "\n" + "\n".join(f"- {line.strip()}" for line in item[field]))
+    sections.append("✨ 本日の注目ポイント\n" + item["highlight"].strip())
+    return "\n\n".join(sections)
+
+
+def parse_batch_response(text, job_ids):
+    """一括要約の応答を検証し、{ジョブID: 要約} を返す（形式が正しいジョブだけ）"""
+    data = json.loads(text)
+    if not isinstance(data, list):
+        raise ValueError("応答が配列ではありません")
+    results = {}
+    for item in data:
+        if not isinstance(item, dict) or not isinstance(item.get("job_id"), str) \
+                or item["job_id"] not in job_ids or item["job_id"] in results:
+            continue
+        if not all(isinstance(item.get(field), list) and all(isinstance(line, str) and line.strip()
+                                                             for line in item[field])
+                   for field, _ in SUMMARY_CATEGORIES):
+            continue
+        if not isinstance(item.get("highlight"), str) or not item["highlight"].strip():
+            continue
+        if not any(item[field] for field, _ in SUMMARY_CATEGORIES):
+            continue
+        results[item["job_id"]] = render_digest(item)
+    return results
+
+
+def _pack_batches(jobs, budget):
+    """ジョブを推定トークンの合計が budget 以下になるようにまとめる"""
+    batches = []
+    current = {}
+    used = 0
+    for job_id, entries in jobs.items():
+        tokens = sum(estimate_tokens(e) for e in entries)
+        if current and used + tokens > budget:
+            batches.append(current)
+            current = {}
+            used = 0
+        current[job_id] = entries
+        used += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def summarize_batch(jobs, client=None):
+    """複数グループの要約を1回のリクエストでまとめて生成（応答は JSON スキーマで構造化）
+
+    jobs: {グループキー: 整形済みツイート}。分割せずに1回で要約できる大きさのものだけを渡す。
+    戻り値: {グループキー: 要約}。応答の検証に失敗したグループは含めない（呼び出し側で個別に要約する）
+    """
+    today = datetime.now().strftime("%Y年%m月%d日")
+    cache = SummaryCache(max_entries=SUMMARY_CACHE_ENTRIES, max_age_days=SUMMARY_CACHE_DAYS)
+    results = {}
+    todo = {}
+    for key, entries in jobs.items():
+        summary = cache.get(_summary_cache_key(entries, today))
+        if summary is None:
+            todo[key] = entries
+        else:
+            results[key] = summary
+            metrics.count("cache_hits")
+    batches = [batch for batch in _pack_batches(todo, SUMMARY_BATCH_TOKENS) if len(batch) > 1]
+    if not batches:
+        return results
+
+    print(f"[2/3] Gemini APIで{sum(len(b) for b in batches)}件の要約を{len(batches)}回のリクエストで一括生成中...")
+    client = client or make_gemini_client()
+    semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+    config = {"response_mime_type": "application/json", "response_schema": BATCH_SCHEMA}
+    categories = "\n".join(f"   - {field}: {heading}" for field, heading in SUMMARY_CATEGORIES)
+
+    async def run(index, batch):
+        job_ids = {f"job{i}": key for i, key in enumerate(batch, 1)}
+        prompt = BATCH_PROMPT.format(
+            today=today, count=len(batch), categories=categories,
+            jobs="\n\n".join(f"=== 依頼 {job_id} ===\n{TWEET_SEPARATOR.join(batch[key])}"
+                              for job_id, key in job_ids.items())
+        )
+        async with semaphore:
+            try:
+                parsed = parse_batch_response(await _generate(client, prompt, f"一括{index}", config=config), job_ids)
+            except Exception as e:
+                # 一括生成に失敗しても、各グループを個別に要約し直せばよい
+                print(f"  ⚠️ 一括要約{index}に失敗しました（個別に要約します）: {type(e).__name__}: {e}")
+                parsed = {}
+        for job_id, summary in parsed.items():
+            key = job_ids[job_id]
+            cache.put(_summary_cache_key(batch[key], today), summary)
+            results[key] = summary
+        metrics.count("batched_digests", len(parsed))
+        if len(parsed) < len(batch):
+            metrics.count("batch_fallbacks", len(batch) - len(parsed))
+            print(f"  ⚠️ 一括要約{index}: {len(batch) - len(parsed)}件は応答の形式が不正なため個別に要約します")
+        print(f"  → 一括要約{index}/{len(batches)} 完了（{len(parsed)}/{len(batch)}件）")
+
+    await asyncio.gather(*(run(i, batch) for i, batch in enumerate(batches, 1)))
+    return results
+
+
+async def summarize_groups(groups, entries_by_group, earlier_by_group, client=None, summaries=None, save=None):
+    """受け取るリストの組み合わせごとに要約を作る
+
+    分割せずに1回で要約できるグループが複数あれば summarize_batch でまとめて生成し、
+    残りと一括生成で検証に失敗したグループを1件ずつ要約する。
+    summaries: 途中まで作成済みの要約、save: 要約が増えるたびに呼ぶ関数（途中経過の保存用）
+    戻り値: {グループキー: 要約}
+    """
+    summaries = dict(summaries or {})
+    todo = []
+    for ids in groups:
+        key = _group_key(ids)
+        if not entries_by_group[key] and not earlier_by_group[key]:
+            _group_label(groups, ids)
+            print("新着ツイートがありませんでした。")
+        elif key not in summaries:
+            todo.append(ids)
+
+    batchable = {
+        _group_key(ids): entries_by_group[_group_key(ids)] for ids in todo
+        if not earlier_by_group[_group_key(ids)]
+        and sum(estimate_tokens(e) for e in entries_by_group[_group_key(ids)]) <= SUMMARY_CHUNK_TOKENS
+    }
+    # ストリーミングは1件ずつ表示するため一括にしない
+    if SUMMARY_BATCH_TOKENS and not STREAM_SUMMARY and len(batchable) > 1:
+        with metrics.stage("summarize"):
+            batched = await summarize_batch(batchable, client)
+        if batched:
+            summaries.update(batched)
+            if save:
+                save(summaries)
+
+    for ids in todo:
+        key = _group_key(ids)
+        if key in summaries:
+            continue
+        _group_label(groups, ids)
+        # 宛先グループが複数あるときは、ストリーミングの出力ファイルをグループの番号で分ける
+        suffix = f"_{list(groups).index(ids) + 1}" if len(groups) > 1 else ""
+        with metrics.stage("summarize"):
+            summary = await summarize_with_gemini(entries_by_group[key], client, earlier_by_group[key], suffix)
+        if not summary:
+            raise RuntimeError("要約の生成に失敗しました（要約が空です）")
+        summaries[key] = summary
+        if save:
+            save(summaries)
+    return summaries
+
+
+def recipient_groups():
+    """宛先を、受け取るリストの組み合わせごとにまとめる
+
+    戻り値: {(リストID, ...): [メールアドレス, ...]}（宛先の設定がなければ gmail_user に全リスト）
+    """
+    groups = {}
+    for recipient in RECIPIENTS or [GMAIL_USER]:
+        if isinstance(recipient, dict):
+            email, lists = recipient["email"], recipient.get("lists", [])
+        else:
+            email, lists = recipient, []
+        wanted = {_list_id(url) for url in lists}
+        unknown = wanted - set(LIST_IDS)
+        if unknown:
+            print(f"  ⚠️ {email}: 未登録のリスト {', '.join(sorted(unknown))} は無視します")
+        ids = tuple(i for i in LIST_IDS if i in wanted) or tuple(LIST_IDS)
+        if email not in groups.setdefault(ids, []):
+            groups[ids].append(email)
+    return groups
+
+
+def send_emails(digests, sent, label, rejected=None):
+    """要約を各宛先に送信（1つのSMTP接続を使い回し、SMTP_BATCH_SIZE 通ごとに接続し直す）
+
+    digests: [(宛先のリスト, 要約)]
+    sent: 送信済みの宛先の集合（リトライ時に同じ宛先へ二重送信しないよう、送るたびに追加）
+    label: 件名に入れる日付
+    rejected: 宛先 → 恒久的に拒否された理由（存在しないアドレスなど 5xx。記録して残りの宛先へ送り続ける）
+    """
+    import smtplib
+    from mailer import MailSession, build_message
+
+    rejected = {} if rejected is None else rejected
+    pending = [(to, summary) for recipients, summary in digests for to in recipients
+               if to not in sent and to not in rejected]
+    print(f"[3/3] メール送信中... ({len(pending)}通)")
+    subject = f"📰 Xリスト AI要約 ({label})"
+
+    with MailSession(SMTP_HOST, SMTP_PORT, GMAIL_USER, GMAIL_APP_PASSWORD, use_ssl=SMTP_SSL,
+                     batch_size=SMTP_BATCH_SIZE, allow_plaintext=SMTP_ALLOW_PLAINTEXT) as session:
+        try:
+            for to, summary in pending:
+                try:
+                    session.send(build_message(summary, GMAIL_USER, to, subject))
+                except smtplib.SMTPRecipientsRefused as e:
+                    code, message = e.recipients.get(to, (None, b""))
+                    if code is None or code < 500:
+                        raise  # 一時的な拒否（4xx）は deliver() のリトライに任せる
+                    reason = f"{code} {message.decode('utf-8', 'replace')}"
+                    rejected[to] = reason
+                    metrics.count("recipients_rejected")
+                    print(f"  ⚠️ {to} は受信を拒否されたため送信しません: {reason}")
+                    continue
+                sent.add(to)
+                metrics.count("messages")
+                print(f"  → {to} に送信完了！")
+        finally:
+            metrics.count("connections", session.connects)
+
+
+async def deliver(digests, sent=None, label=None, rejected=None):
+    """送信をスレッドで実行し、一時的なSMTPエラーなら未送信の宛先だけリトライ"""
+    sent = set() if sent is None else sent
+    label = label or datetime.now().strftime("%Y/%m/%d")
+    await _retry(asyncio.to_thread, send_emails, digests, sent, label, rejected, label="メール送信")
+
+
+async def drain_outbox():
+    """送信待ちの要約（今回の分と、前回までに送れなかった分）を古い順に送信
+
+    失敗した項目は送信済みの宛先と次に試す時刻を記録して outbox/ に残す。
+    戻り値: 送信待ちがすべて送れたらTrue
+    """
+    ok = True
+    for item in outbox.pending(OUTBOX_DIR):
+        if outbox.expired(item):
+            item.give_up()
+            print(f"  ❌ {item.data['label']} の要約は{outbox.MAX_AGE_DAYS}日以上送信できなかったため、outbox/failed/ に移しました")
+            ok = False
+            continue
+        if item.data["attempts"]:
+            print(f"📮 送信待ちの要約を再送します: {item.data['label']}（{item.data['attempts'] + 1}回目）")
+        sent, rejected = item.sent, item.rejected
+        try:
+            await deliver(item.digests, sent, item.data["label"], rejected)
+        except Exception as e:
+            item.record_failure(f"{type(e).__name__}: {e}", sent, rejected)
+            print(f"  ❌ メール送信に失敗: {type(e).__name__}: {e}")
+            print(f"     要約は outbox/{item.name} に保存済みです。次回の実行で送信だけをやり直します")
+            ok = False
+        else:
+            # 拒否された宛先は outbox/delivered/ の項目に理由とともに残る
+            item.mark_delivered(sent, rejected)
+    return ok
 
 
 def mark_sent_today():
@@ -150,39 +946,299 @@ def mark_sent_today():
         f.write(today)
 
 
-async def async_main():
+def _group_key(ids):
+    return ",".join(ids)
+
+
+def _group_label(groups, ids):
+    """複数の宛先グループがあるときだけ見出しを表示"""
+    if len(groups) > 1:
+        print(f"--- {', '.join(groups[ids])} 宛て（{len(ids)}リスト） ---")
+
+
+async def async_main(offline=False, hours=None, x_client=None, gemini_client=None, from_stage=None):
     print("=" * 50)
     print(f"Xリスト自動要約システム v3 - {datetime.now().strftime('%Y/%m/%d %H:%M')}")
     print("=" * 50)
 
-    if already_sent_today():
+    # 前回までに送れなかった要約があれば先に送る
+    if outbox_pending():
+        await drain_outbox()
+
+    if not offline and not from_stage and already_sent_today():
         print("📬 本日はすでに送信済みです。スキップします。")
+        metrics.notify("already_sent")
         return
 
+    groups = recipient_groups()
+    # 再生成（--offline）はチェックポイントを使わない
+    ckpt = None
+    start = "fetch"
+    if not offline:
+        checkpoint.prune(CHECKPOINT_DIR)
+        ckpt = checkpoint.Checkpoint(checkpoint.make_key(LIST_IDS, sorted(groups.items())), base_dir=CHECKPOINT_DIR)
+        # すべて完了済み（.last_run を消して再実行した場合など）は最初から
+        start = from_stage or ckpt.resume_stage() or "fetch"
+        for stage in checkpoint.STAGES[:checkpoint.STAGES.index(start)]:
+            if not ckpt.completed(stage):
+                print(f"❌ 本日の「{metrics.STAGE_LABELS[stage]}」のチェックポイントがないため、--from-stage {start} は使えません")
+                return
+        if start != "fetch":
+            print(f"♻️ 本日のチェックポイントから再開します（{metrics.STAGE_LABELS[start]}から）")
+
+    def redo(stage):
+        return checkpoint.STAGES.index(stage) >= checkpoint.STAGES.index(start)
+
+    metrics.start_run("offline" if offline else "daily" if start == "fetch" else "resume")
     try:
-        raw_text = await fetch_x_list()
-        if not raw_text:
-            print("ツイートが取得できませんでした。")
-            return
+        with TweetStore() as store:
+            with metrics.stage("fetch"):
+                if offline:
+                    # X には接続せず、保存済みツイートから要約を作り直す
+                    print(f"[1/3] ツイートストアから直近{hours}時間分を読み込み中...")
+                    since = time.time() - hours * 3600
+                    new_marks = {}
+                elif redo("fetch"):
+                    marks = load_watermarks()
+                    since = window_starts(marks, LIST_IDS)
+                    # 途中経過を作成済みなら、その時点以降の新着だけを取得
+                    partial_marks = store.partial_marks()
+                    new_marks = {**partial_marks, **await fetch_all_lists(store, {**marks, **partial_marks}, x_client)}
+                    store.prune(STORE_RETENTION_DAYS)
+                    ckpt.save("fetch", {"since": since, "new_marks": new_marks})
+                else:
+                    fetched = ckpt.load("fetch")
+                    since, new_marks = fetched["since"], fetched["new_marks"]
+                if redo("preprocess"):
+                    # 途中経過があるグループは、最後の途中経過より後に取得した投稿だけを読む
+                    rows_by_group = {}
+                    earlier_by_group = {}
+                    for ids in groups:
+                        partials = [] if offline else store.get_partials(_group_key(ids))
+                        fetched_after = partials[-1]["until"] if partials else 0
+                        rows_by_group[ids] = store.get_window(list(ids), since, fetched_after=fetched_after)
+                        earlier_by_group[_group_key(ids)] = [p["summary"] for p in partials if p["summary"]]
 
-        summary = summarize_with_gemini(raw_text)
-        if not summary:
-            print("要約の生成に失敗しました。")
+        # 受け取るリストの組み合わせごとに要約を作る（同じ組み合わせの宛先は同じ要約）
+        if redo("preprocess"):
+            entries_by_group = {}
+            for ids in groups:
+                _group_label(groups, ids)
+                earlier = earlier_by_group[_group_key(ids)]
+                # 前処理が済んだグループの行はすぐ手放す（投稿の多い日のピークメモリを抑える）
+                rows = rows_by_group.pop(ids)
+                note = f"（途中経過の要約{len(earlier)}件あり）" if earlier else ""
+                print(f"  → 要約対象: {len(rows)}件{note}")
+                with metrics.stage("preprocess"):
+                    entries_by_group[_group_key(ids)] = await preprocess_tweets(rows)
+                del rows
+            if ckpt:
+                ckpt.save("preprocess", {"entries": entries_by_group, "earlier": earlier_by_group})
+        else:
+            saved = ckpt.load("preprocess")
+            entries_by_group, earlier_by_group = saved["entries"], saved["earlier"]
+
+        if redo("summarize"):
+            # グループごとに要約が終わるたびに途中経過を保存（失敗したグループから再開できる）
+            saved = ckpt.load("summarize") if ckpt and start == "summarize" and not from_stage else None
+            summaries = await summarize_groups(
+                groups, entries_by_group, earlier_by_group, gemini_client, saved,
+                save=(lambda done: ckpt.save("summarize", done, completed=False)) if ckpt else None
+            )
+            if ckpt:
+                ckpt.save("summarize", summaries)
+        else:
+            summaries = ckpt.load("summarize")
+
+        digests = [(recipients, summaries[_group_key(ids)])
+                   for ids, recipients in groups.items() if _group_key(ids) in summaries]
+        if not digests:
+            metrics.finish("empty")
             return
 
-        send_email(summary)
-        mark_sent_today()
+        # 送信前に outbox/ に保存する。ここから先は送信に失敗しても取得・要約はやり直さない
+        item = outbox.enqueue(digests, datetime.now().strftime("%Y/%m/%d"), OUTBOX_DIR)
+        if ckpt:
+            ckpt.save("send", {"outbox": item.name})
+            mark_sent_today()
+            save_watermarks(new_marks)
+            # 送信する要約に含めた途中経過は削除
+            with TweetStore() as store:
+                store.clear_partials()
+
+        with metrics.stage("send"):
+            await drain_outbox()
+        if os.path.exists(item.path):
+            metrics.finish("queued")
+            print()
+            print("⚠️ 要約は作成済みですが、送信できませんでした（次回の実行で再送します）")
+            return
+        metrics.finish("ok")
         print()
-        print("✅ すべて完了しました！")
+        print("✅ 再生成した要約を送信しました！" if offline else "✅ すべて完了しました！")
 
     except Exception as e:
         print(f"❌ エラー発生: {type(e).__name__}: {e}")
+        metrics.finish("error", f"{type(e).__name__}: {e}")
         import traceback
         traceback.print_exc()
 
 
+# --- 途中経過（日中の部分要約） ---
+
+async def summarize_increment(entries, since, until, client):
+    """途中経過分の投稿を要点抽出（多い場合は分割して並行実行し、結果をつなげる）"""
+    today = datetime.now().strftime("%Y年%m月%d日")
+    start, end = (datetime.fromtimestamp(t).strftime("%H:%M") for t in (since, until))
+    semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+
+    async def summarize_chunk(index, chunk):
+        prompt = PARTIAL_PROMPT.format(today=today, start=start, end=end, raw_text=TWEET_SEPARATOR.join(chunk))
+        async with semaphore:
+            return await _generate(client, prompt, f"途中経過{index}")
+
+    parts = await asyncio.gather(
+        *(summarize_chunk(i, chunk) for i, chunk in enumerate(split_into_chunks(entries, SUMMARY_CHUNK_TOKENS), 1))
+    )
+    return "\n\n".join(part for part in parts if part)
+
+
+async def run_increment(x_client=None, gemini_client=None):
+    """日中の途中経過: 前回以降の新着を取得して部分要約を保存する（送信はしない）
+
+    毎日の実行では、保存済みの部分要約と最後の途中経過以降の投稿だけを統合するため、
+    実行時刻の処理が軽くなる。
+    """
+    print(f"🧩 途中経過の要約 - {datetime.now().strftime('%Y/%m/%d %H:%M')}")
+    metrics.start_run("increment")
+    try:
+        groups = recipient_groups()
+        with TweetStore() as store:
+            daily_marks = load_watermarks()
+            marks = {**daily_marks, **store.partial_marks()}
+            with metrics.stage("fetch"):
+                marks.update(await fetch_all_lists(store, marks, x_client))
+            # 前回の途中経過より後に取得した分が今回の対象
+            until = time.time()
+            client = gemini_client or make_gemini_client()
+            for ids in groups:
+                key = _group_key(ids)
+                partials = store.get_partials(key)
+                since = partials[-1]["until"] if partials else window_start(daily_marks, ids)
+                rows = store.get_window(list(ids), window_starts(daily_marks, ids),
+                                        fetched_after=partials[-1]["until"] if partials else 0)
+                _group_label(groups, ids)
+                with metrics.stage("preprocess"):
+                    entries = await preprocess_tweets(rows)
+                summary = ""
+                if entries:
+                    with metrics.stage("summarize"):
+                        summary = await summarize_increment(entries, since, until, client)
+                store.add_partial(key, since, until, summary, len(rows), marks)
+                print(f"  → 途中経過を保存: {len(rows)}件 ({len(store.get_partials(key))}件目)")
+        metrics.finish("ok")
+    except Exception as e:
+        print(f"❌ 途中経過の作成に失敗: {type(e).__name__}: {e}")
+        metrics.finish("error", f"{type(e).__name__}: {e}")
+
+
+# --- 常駐モード ---
+
+def _due_today(now):
+    """今日の実行時刻を過ぎていて、まだ送信していなければTrue"""
+    hour, minute = (int(v) for v in SCHEDULE_TIME.split(":"))
+    return now >= now.replace(hour=hour, minute=minute, second=0, microsecond=0) and not already_sent_today()
+
+
+async def run_daemon(poll_seconds=30, retry_minutes=30):
+    """常駐して schedule_time に毎日実行する
+
+    twikit / Gemini のクライアントを1つずつ作って使い回すため、
+    実行ごとのインポートや接続確立のコストがかからない。
+    settings.json が更新されたら読み直してクライアントを作り直す。
+    """
+    print(f"🕒 常駐モードで起動しました（毎日 {SCHEDULE_TIME} に実行、Ctrl+C で終了）")
+    settings_mtime = settings_store.settings_mtime()
+    x_client = make_x_client()
+    gemini_client = make_gemini_client()
+    next_attempt = 0
+    with TweetStore() as store:
+        latest = store.latest_partial()
+    last_increment = latest["created_at"] if latest else 0
+
+    while True:
+        mtime = settings_store.settings_mtime()
+        if mtime is not None and mtime != settings_mtime:
+            settings_mtime = mtime
+            try:
+                _apply_settings(settings_store.load_settings())
+            except Exception as e:
+                print(f"⚠️ settings.json の再読み込みに失敗: {type(e).__name__}: {e}")
+            else:
+                x_client = make_x_client()
+                gemini_client = make_gemini_client()
+                print(f"🔄 設定を再読み込みしました（毎日 {SCHEDULE_TIME} に実行）")
+
+        if outbox_pending():
+            await drain_outbox()
+
+        # 途中経過: 実行時刻前の間、incremental_hours 時間ごとに部分要約を作っておく
+        if INCREMENTAL_HOURS and time.time() - last_increment >= INCREMENTAL_HOURS * 3600 \
+                and not _due_today(datetime.now()):
+            last_increment = time.time()
+            await run_increment(x_client=x_client, gemini_client=gemini_client)
+
+        if time.time() >= next_attempt and _due_today(datetime.now()):
+            await async_main(x_client=x_client, gemini_client=gemini_client)
+            if not already_sent_today():
+                # 失敗時はしばらく待ってから再実行
+                next_attempt = time.time() + retry_minutes * 60
+                print(f"  ⏳ {retry_minutes}分後に再実行します")
+
+        await asyncio.sleep(poll_seconds)
+
+
 def main():
-    asyncio.run(async_main())
+    parser = argparse.ArgumentParser(description="Xリスト自動要約→Gmail送信")
+    parser.add_argument("--offline", action="store_true",
+                        help="Xに接続せず、ツイートストアの保存済みツイートから要約を再生成して送信")
+    parser.add_argument("--hours", type=int,
+                        help="--offline 時に要約する期間（直近何時間か、省略時は first_run_hours）")
+    parser.add_argument("--stream", action="store_true",
+                        help="要約をストリーミングで生成し、生成中の内容をコンソールと output/ に書き出す")
+    parser.add_argument("--skip-if-sent", action="store_true",
+                        help="本日送信済みなら、ライブラリや設定を読み込まずにすぐ終了（判定はモジュール冒頭で実施）")
+    parser.add_argument("--daemon", action="store_true",
+                        help="常駐して schedule_time に毎日実行（クライアントを使い回す）")
+    parser.add_argument("--from-stage", choices=checkpoint.STAGES,
+                        help="本日のチェックポイントを使い、指定した段階からやり直す（fetch / preprocess / summarize / send）")
+    parser.add_argument("--incremental", action="store_true",
+                        help="途中経過だけを作成（前回以降の新着を取得して部分要約を保存、送信はしない）")
+    parser.add_argument("--drain", action="store_true",
+                        help="取得・要約はせず、outbox/ の送信待ちの要約だけを送信")
+    parser.add_argument("--progress", action="store_true",
+                        help="実行中の段階・件数・所要時間を1行のJSONで標準出力に書く（設定画面の「今すぐ実行」用）")
+    args = parser.parse_args()
+    if args.progress:
+        metrics.add_listener(metrics.print_progress)
+    _apply_settings(_load_settings())
+    if args.stream:
+        global STREAM_SUMMARY
+        STREAM_SUMMARY = True
+    if args.incremental:
+        asyncio.run(run_increment())
+        return
+    if args.drain:
+        if not asyncio.run(drain_outbox()):
+            sys.exit(1)
+        return
+    if args.daemon:
+        try:
+            asyncio.run(run_daemon())
+        except KeyboardInterrupt:
+            print("常駐モードを終了しました")
+        return
+    asyncio.run(async_main(offline=args.offline, hours=args.hours or FIRST_RUN_HOURS, from_stage=args.from_stage))
 
 
 if __name__ == "__main__":
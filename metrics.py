@@ -0,0 +1,275 @@
+"""
+実行ごとの計測値（段階ごとの処理時間・件数・リトライ・トークン数）
+
+main.py の各段階を stage() で囲み、count() で件数やトークン数を加算する。
+実行の最後に finish() で metrics.jsonl に1行（1実行）追記し、
+設定画面のグラフと /metrics（Prometheus形式）で参照する。
+metrics.jsonl は古い実行から削除するため、Prometheus の counter に使う累計は
+metrics_totals.json に別に積み上げる（減らない）。
+実行中の値は add_listener() で登録した関数に渡す（設定画面の「今すぐ実行」の進捗表示用）。
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import retry
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+METRICS_FILE = os.path.join(SCRIPT_DIR, "metrics.jsonl")
+TOTALS_FILE = os.path.join(SCRIPT_DIR, "metrics_totals.json")
+MAX_RUNS = 500  # metrics.jsonl に残す実行数
+PROGRESS_INTERVAL = 0.5  # 実行中の値を知らせる最短の間隔（秒。段階の開始・終了は必ず知らせる）
+PROGRESS_PREFIX = "@@progress "  # print_progress() が標準出力に書く行の先頭
+
+STAGE_LABELS = {"fetch": "取得", "preprocess": "前処理", "summarize": "要約", "send": "送信"}
+
+
+class RunMetrics:
+    """1回の実行の計測値"""
+
+    def __init__(self, mode="daily"):
+        self.mode = mode
+        self.started = time.time()
+        self.stages = {}
+        self.current = None
+        self.current_started = None
+        self._notified = 0.0
+
+    def _changed(self, force=False):
+        if not _listeners:
+            return
+        now = time.time()
+        if not force and now - self._notified < PROGRESS_INTERVAL:
+            return
+        self._notified = now
+        snapshot = self.snapshot()
+        for listener in list(_listeners):
+            listener(snapshot)
+
+    def snapshot(self, status="running"):
+        """実行中の値（今の段階と、その段階を始めた時刻つき）"""
+        data = self.to_dict(status)
+        data["current"] = self.current
+        data["current_started"] = self.current_started
+        return data
+
+    @contextmanager
+    def stage(self, name):
+        """段階の処理時間と、その間に発生したリトライ回数・待機時間を記録"""
+        record = self.stages.setdefault(name, {})
+        retries, waited = retry.stats.retries, retry.stats.wait_seconds
+        previous = (self.current, self.current_started)
+        self.current, self.current_started = name, time.time()
+        self._changed(force=True)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            self.current, self.current_started = previous
+            record["seconds"] = record.get("seconds", 0.0) + time.perf_counter() - start
+            record["retries"] = record.get("retries", 0) + retry.stats.retries - retries
+            record["retry_wait_seconds"] = record.get("retry_wait_seconds", 0.0) + retry.stats.wait_seconds - waited
+            self._changed(force=True)
+
+    def count(self, key, value=1):
+        """現在の段階のカウンターに加算（段階の外なら "run" にまとめる）"""
+        record = self.stages.setdefault(self.current or "run", {})
+        record[key] = record.get(key, 0) + value
+        self._changed()
+
+    def to_dict(self, status, error=None):
+        stages = {
+            name: {k: round(v, 3) if isinstance(v, float) else v for k, v in record.items()}
+            for name, record in self.stages.items()
+        }
+        data = {
+            "started": round(self.started, 3),
+            "date": time.strftime("%Y-%m-%d %H:%M", time.localtime(self.started)),
+            "mode": self.mode,
+            "status": status,
+            "seconds": round(time.time() - self.started, 3),
+            "stages": stages,
+        }
+        if error:
+            data["error"] = error
+        return data
+
+
+_listeners = []
+current = RunMetrics()
+
+
+def start_run(mode="daily"):
+    """新しい実行の計測を始める"""
+    global current
+    current = RunMetrics(mode)
+    return current
+
+
+def stage(name):
+    return current.stage(name)
+
+
+def count(key, value=1):
+    current.count(key, value)
+
+
+def add_listener(func):
+    """実行中の値が変わったときに呼ぶ関数を登録（func(snapshot)、PROGRESS_INTERVAL 秒に1回まで）"""
+    _listeners.append(func)
+
+
+def notify(status):
+    """計測を記録せずに、実行の結果だけを登録した関数に知らせる（送信済みでスキップしたときなど）"""
+    snapshot = RunMetrics().snapshot(status)
+    for listener in list(_listeners):
+        listener(snapshot)
+
+
+def print_progress(snapshot):
+    """実行中の値を PROGRESS_PREFIX つきの1行のJSONで標準出力に書く（main.py --progress）"""
+    print(PROGRESS_PREFIX + json.dumps(snapshot, ensure_ascii=False), flush=True)
+
+
+def finish(status, error=None):
+    """計測結果を metrics.jsonl に追記（古い実行は MAX_RUNS 件を超えたら削除）"""
+    data = current.to_dict(status, error)
+    for listener in list(_listeners):
+        listener({**data, "current": None, "current_started": None})
+    timings = " / ".join(
+        f"{STAGE_LABELS.get(name, name)} {record['seconds']:.1f}秒"
+        for name, record in data["stages"].items() if "seconds" in record
+    )
+    print(f"  ⏱ 所要時間: {timings}（合計 {data['seconds']:.1f}秒）")
+    line = json.dumps(data, ensure_ascii=False)
+    try:
+        with open(METRICS_FILE, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+        with open(METRICS_FILE, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        if len(lines) > MAX_RUNS:
+            tmp_path = METRICS_FILE + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(lines[-MAX_RUNS:])
+            os.replace(tmp_path, METRICS_FILE)
+        _add_to_totals(data)
+    except OSError as e:
+        # 計測の保存に失敗しても本処理は止めない
+        print(f"  ⚠️ 計測結果を保存できませんでした: {e}")
+
+
+def load_history(limit=None):
+    """過去の実行の計測値（古い順）。壊れた行は読み飛ばす"""
+    if not os.path.exists(METRICS_FILE):
+        return []
+    runs = []
+    with open(METRICS_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                runs.append(json.loads(line))
+            except ValueError:
+                continue
+    return runs[-limit:] if limit else runs
+
+
+# --- 累計（Prometheus の counter 用） ---
+
+TOTAL_KEYS = ("seconds", "retry_wait_seconds", "retries")
+
+
+def _empty_totals():
+    return {"runs": {}, "stages": {}}
+
+
+def _add_run(totals, run):
+    totals["runs"][run["status"]] = totals["runs"].get(run["status"], 0) + 1
+    for name, record in run.get("stages", {}).items():
+        total = totals["stages"].setdefault(name, {key: 0 for key in TOTAL_KEYS})
+        for key in TOTAL_KEYS:
+            total[key] += record.get(key, 0)
+
+
+def _read_totals():
+    try:
+        with open(TOTALS_FILE, "r", encoding="utf-8") as f:
+            totals = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return totals if isinstance(totals, dict) and {"runs", "stages"} <= totals.keys() else None
+
+
+def load_totals():
+    """実行回数・段階ごとの時間などの累計（metrics_totals.json がまだなければ metrics.jsonl から集計）"""
+    totals = _read_totals()
+    if totals is None:
+        totals = _empty_totals()
+        for run in load_history():
+            _add_run(totals, run)
+    return totals
+
+
+def _add_to_totals(run):
+    """累計に1実行分を足す（初回は追記済みの metrics.jsonl から作る）"""
+    totals = _read_totals()
+    if totals is None:
+        totals = load_totals()
+    else:
+        _add_run(totals, run)
+    tmp_path = TOTALS_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(totals, f, ensure_ascii=False)
+    os.replace(tmp_path, TOTALS_FILE)
+
+
+# --- Prometheus 形式 ---
+
+def _metric_name(key):
+    return "xsummary_" + "".join(c if c.isalnum() else "_" for c in key)
+
+
+def prometheus_text(runs, totals=None):
+    """計測履歴を Prometheus のテキスト形式に変換
+
+    実行回数・段階ごとの累計時間は counter（totals、省略時は runs から集計）、
+    直近の実行の値は gauge として出力する。
+    """
+    out = []
+
+    def metric(name, kind, help_text, samples):
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+            out.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    if totals is None:
+        totals = _empty_totals()
+        for run in runs:
+            _add_run(totals, run)
+    stages = totals["stages"]
+
+    metric("xsummary_runs_total", "counter", "実行回数（結果別）",
+           [({"status": status}, n) for status, n in sorted(totals["runs"].items())])
+    metric("xsummary_stage_seconds_total", "counter", "段階ごとの処理時間の累計（秒）",
+           [({"stage": name}, round(t["seconds"], 3)) for name, t in stages.items()])
+    metric("xsummary_stage_retries_total", "counter", "段階ごとのリトライ回数の累計",
+           [({"stage": name}, t["retries"]) for name, t in stages.items()])
+    metric("xsummary_stage_retry_wait_seconds_total", "counter", "段階ごとのリトライ待機時間の累計（秒）",
+           [({"stage": name}, round(t["retry_wait_seconds"], 3)) for name, t in stages.items()])
+
+    if runs:
+        last = runs[-1]
+        metric("xsummary_last_run_timestamp_seconds", "gauge", "直近の実行の開始時刻（UNIX秒）",
+               [({}, last["started"])])
+        metric("xsummary_last_run_duration_seconds", "gauge", "直近の実行の所要時間（秒）",
+               [({}, last["seconds"])])
+        metric("xsummary_last_run_success", "gauge", "直近の実行が成功したら1",
+               [({}, 1 if last["status"] == "ok" else 0)])
+        counters = {}
+        for name, record in last.get("stages", {}).items():
+            for key, value in record.items():
+                counters.setdefault(key, []).append(({"stage": name}, value))
+        for key, samples in sorted(counters.items()):
+            metric(_metric_name("last_run_" + key), "gauge", f"直近の実行の {key}", samples)
+    return "\n".join(out) + "\n"
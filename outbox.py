@@ -0,0 +1,135 @@
+"""
+送信待ちの要約（アウトボックス）
+
+生成した要約は送信前に outbox/ に保存し、全員に送れたら outbox/delivered/ に移す。
+SMTPの障害で送れなかった場合も要約はファイルに残るため、次回の実行
+（常駐モードでは数十秒おき）で送信だけをやり直し、取得・要約をやり直す必要はない。
+送信済みの宛先は項目ごとに記録するので、やり直しで同じ人に二重送信しない。
+存在しないアドレスなど恒久的に拒否された宛先も理由とともに記録し、やり直しでは送らない。
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from jsonfile import write_atomic
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTBOX_DIR = os.path.join(SCRIPT_DIR, "outbox")
+
+BASE_DELAY = 60  # 送信失敗後、次に試すまでの待ち時間（秒、失敗のたびに倍）
+MAX_DELAY = 3600
+MAX_AGE_DAYS = 3  # これより古い未送信の項目は outbox/failed/ に移してあきらめる
+KEEP_DELIVERED = 30  # outbox/delivered/ に残す件数
+
+
+class OutboxItem:
+    """outbox/ の1ファイル（1回分の要約と宛先、送信状況）"""
+
+    def __init__(self, path, data):
+        self.path = path
+        self.data = data
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    @property
+    def digests(self):
+        """[(宛先のリスト, 要約)]"""
+        return [(d["recipients"], d["summary"]) for d in self.data["digests"]]
+
+    @property
+    def sent(self):
+        return set(self.data["sent"])
+
+    @property
+    def rejected(self):
+        """{宛先: 拒否された理由}（古い項目にはないため空）"""
+        return dict(self.data.get("rejected", {}))
+
+    def save(self, sent=None, rejected=None):
+        if sent is not None:
+            self.data["sent"] = sorted(sent)
+        if rejected is not None:
+            self.data["rejected"] = rejected
+        write_atomic(self.path, self.data, indent=2)
+
+    def record_failure(self, error, sent, rejected=None):
+        """失敗を記録し、次に試す時刻を指数バックオフで決める"""
+        self.data["attempts"] += 1
+        self.data["last_error"] = error
+        self.data["next_attempt"] = time.time() + min(MAX_DELAY, BASE_DELAY * 2 ** (self.data["attempts"] - 1))
+        self.save(sent, rejected)
+
+    def mark_delivered(self, sent, rejected=None):
+        """拒否された宛先以外の全員に送信できたら delivered/ に移す"""
+        self.data["delivered_at"] = time.time()
+        self.save(sent, rejected)
+        _move(self.path, "delivered")
+        _prune_delivered(os.path.dirname(self.path))
+
+    def give_up(self):
+        _move(self.path, "failed")
+
+
+def _move(path, subdir):
+    dest_dir = os.path.join(os.path.dirname(path), subdir)
+    os.makedirs(dest_dir, exist_ok=True)
+    shutil.move(path, os.path.join(dest_dir, os.path.basename(path)))
+
+
+def _prune_delivered(outbox_dir):
+    delivered_dir = os.path.join(outbox_dir, "delivered")
+    names = sorted(n for n in os.listdir(delivered_dir) if n.endswith(".json"))
+    for name in names[:-KEEP_DELIVERED]:
+        os.remove(os.path.join(delivered_dir, name))
+
+
+def enqueue(digests, label, outbox_dir=None):
+    """要約を送信待ちとして保存（送信前に必ず呼ぶ）"""
+    outbox_dir = outbox_dir or OUTBOX_DIR
+    os.makedirs(outbox_dir, exist_ok=True)
+    body = json.dumps(digests, ensure_ascii=False).encode("utf-8")
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{hashlib.sha256(body).hexdigest()[:8]}.json"
+    data = {
+        "label": label,
+        "created": time.time(),
+        "digests": [{"recipients": list(recipients), "summary": summary} for recipients, summary in digests],
+        "sent": [],
+        "rejected": {},
+        "attempts": 0,
+        "next_attempt": 0,
+        "last_error": None,
+    }
+    item = OutboxItem(os.path.join(outbox_dir, name), data)
+    item.save()
+    return item
+
+
+def pending(outbox_dir=None, due_only=True):
+    """送信待ちの項目（古い順）。due_only なら次に試す時刻を過ぎたものだけ"""
+    outbox_dir = outbox_dir or OUTBOX_DIR
+    if not os.path.isdir(outbox_dir):
+        return []
+    items = []
+    now = time.time()
+    for name in sorted(os.listdir(outbox_dir)):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(outbox_dir, name)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"  ⚠️ 送信待ちファイルを読み込めません: {name} ({e})")
+            continue
+        if due_only and data.get("next_attempt", 0) > now:
+            continue
+        items.append(OutboxItem(path, data))
+    return items
+
+
+def expired(item):
+    return time.time() - item.data["created"] > MAX_AGE_DAYS * 86400
@@ -0,0 +1,300 @@
+"""
+プロンプト作成前のツイート前処理
+
+1. リツイート・完全一致・ほぼ同じ内容の投稿を1件にまとめ、
+   何アカウントが同じ話題を共有したか（echo_count）を残す。
+2. 時刻・URL・定型文を短くし、トークン予算に収まるよう新しい／反応の多い投稿を優先して残す。
+
+1件ずつ独立した重い処理（fingerprint・言語判定・整形・優先度）は analyze_batch / format_batch に
+まとめてあり、件数が多い日は main.py がプロセスプールでバッチごとに並列実行する。
+"""
+import hashlib
+import math
+import re
+import zlib
+from array import array
+from datetime import datetime
+
+URL_RE = re.compile(r"https?://\S+")
+RT_PREFIX_RE = re.compile(r"^RT @\w+:\s*")
+MENTION_RE = re.compile(r"@\w+")
+TRAILING_TAGS_RE = re.compile(r"(?:\s*(?:[#＃]\w+|https?://\S+))+\s*$")
+LEADING_MENTIONS_RE = re.compile(r"^(?:@\w+\s+)+")
+
+NUM_HASHES = 32  # MinHash の署名の長さ
+BANDS = 8  # LSH のバンド数（1バンド = NUM_HASHES / BANDS 行）
+SHINGLE_SIZE = 3  # 文字 n-gram の長さ（日本語でも分かち書き不要）
+
+_BIN_SHIFT = 64 - (NUM_HASHES - 1).bit_length()
+_EMPTY = (1 << 64) - 1  # 空の区間（array("Q") に入る最大値）
+
+
+def normalize_text(text):
+    """比較用に URL・メンション・RT接頭辞・空白の違いを取り除く"""
+    text = RT_PREFIX_RE.sub("", text)
+    text = URL_RE.sub("", text)
+    text = MENTION_RE.sub("", text)
+    return " ".join(text.lower().split())
+
+
+def shingles(text):
+    """文字 n-gram の集合（64bitハッシュ。プロセスをまたいでも同じ値になるよう crc32 を2つ連結）"""
+    if len(text) <= SHINGLE_SIZE:
+        grams = {text}
+    else:
+        grams = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+    hashes = set()
+    for g in grams:
+        data = g.encode("utf-8")
+        hashes.add(zlib.crc32(data) | (zlib.crc32(data, 0x9E3779B9) << 32))
+    return hashes
+
+
+def minhash(hashes):
+    """MinHash 署名（ワンパーミュテーション方式: 上位ビットで NUM_HASHES 個に振り分け、各区間の最小値）"""
+    sig = array("Q", [_EMPTY]) * NUM_HASHES
+    for h in hashes:
+        b = h >> _BIN_SHIFT
+        if h < sig[b]:
+            sig[b] = h
+    return sig
+
+
+def jaccard(a, b):
+    """Jaccard 係数（a は集合、b は集合か重複のない array）"""
+    if not a or not b:
+        return 0.0
+    common = len(a.intersection(b))
+    return common / (len(a) + len(b) - common)
+
+
+def fingerprint(text):
+    """重複判定に使う (正規化テキストのハッシュ, シングルの array, MinHash署名)
+
+    シングルは2万件分を持ち続けるため、集合ではなく 8バイト/個 の array('Q') にしておき、
+    比較するときだけ集合に戻す。URLだけの投稿など、正規化すると空になるものは比較対象にしない。
+    """
+    norm = normalize_text(text)
+    if not norm:
+        return None, array("Q"), minhash(())
+    grams = shingles(norm)
+    return hashlib.sha1(norm.encode("utf-8")).hexdigest(), array("Q", grams), minhash(grams)
+
+
+def detect_language(text):
+    """文字種からおおまかな言語を判定: ja / zh / ko / en / other（短い投稿向けの軽い判定）"""
+    kana = hangul = han = latin = 0
+    for c in MENTION_RE.sub("", URL_RE.sub("", text)):
+        o = ord(c)
+        if 0x3040 <= o <= 0x30FF:
+            kana += 1
+        elif 0xAC00 <= o <= 0xD7AF:
+            hangul += 1
+        elif 0x4E00 <= o <= 0x9FFF:
+            han += 1
+        elif c.isascii() and c.isalpha():
+            latin += 1
+    if kana:
+        return "ja"
+    if hangul > han:
+        return "ko"
+    if han:
+        return "zh"
+    return "en" if latin else "other"
+
+
+def raw_tokens(tweet):
+    """圧縮前の推定トークン（従来の「【@user】(日時)\n本文」を区切り線でつなぐ形式で計算）"""
+    posted = datetime.fromtimestamp(tweet["created_at"])
+    return estimate_tokens(f"【@{tweet['user']}】({posted:%Y-%m-%d %H:%M})\n{tweet['text']}\n\n---\n\n")
+
+
+def analyze_batch(tweets):
+    """fingerprint・言語判定・圧縮前の推定トークンをまとめて計算（プロセスプールでバッチ単位に実行）
+
+    戻り値: [(fingerprint, 言語, 推定トークン)]
+    """
+    return [(fingerprint(t["text"]), detect_language(t["text"]), raw_tokens(t)) for t in tweets]
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def _union(parent, a, b):
+    ra, rb = _find(parent, a), _find(parent, b)
+    if ra != rb:
+        parent[max(ra, rb)] = min(ra, rb)
+
+
+def collapse_duplicates(tweets, threshold=0.7, fingerprints=None):
+    """リツイート・完全一致・類似ツイートを1件にまとめる
+
+    tweets: id / user / created_at / text / favorite_count / retweet_count /
+            retweet_of / retweet_user を持つ dict のリスト
+    threshold: 類似とみなす Jaccard 係数（1.0 なら完全一致のみ）
+    fingerprints: 計算済みの fingerprint() の結果（並列処理用、省略時はここで計算）
+
+    戻り値: 代表ツイートの dict のリスト（echo_count / echo_users を追加、投稿日時順）
+    """
+    n = len(tweets)
+    parent = list(range(n))
+    if fingerprints is None:
+        fingerprints = [fingerprint(t["text"]) for t in tweets]
+
+    # 1) 同じ元ツイートのリツイート、2) 正規化後の完全一致
+    first_by_key = {}
+    for i, t in enumerate(tweets):
+        for key in (("rt", t.get("retweet_of") or t["id"]), ("text", fingerprints[i][0])):
+            if key[1] is None:
+                continue
+            if key in first_by_key:
+                _union(parent, first_by_key[key], i)
+            else:
+                first_by_key[key] = i
+
+    # 3) MinHash + LSH で候補を絞ってから Jaccard 係数で類似判定
+    if threshold < 1.0:
+        rows = NUM_HASHES // BANDS
+        buckets = {}
+        for i, (_, grams, sig) in enumerate(fingerprints):
+            if not grams:
+                continue
+            for band in range(BANDS):
+                key = (band, sig[band * rows:(band + 1) * rows].tobytes())
+                buckets.setdefault(key, []).append(i)
+        for members in buckets.values():
+            # バケット内の各グループの代表とだけ比較する（代表のシングルはこの間だけ集合に戻す）
+            heads = []
+            for j in members:
+                for head, head_grams in heads:
+                    if _find(parent, head) == _find(parent, j) or \
+                            jaccard(head_grams, fingerprints[j][1]) >= threshold:
+                        _union(parent, head, j)
+                        break
+                else:
+                    heads.append((j, set(fingerprints[j][1])))
+
+    groups = {}
+    for i in range(n):
+        groups.setdefault(_find(parent, i), []).append(i)
+
+    collapsed = []
+    for members in groups.values():
+        # 反応（いいね＋RT）が最も多い投稿を代表にする
+        best = max(members, key=lambda i: (tweets[i]["favorite_count"] + tweets[i]["retweet_count"], -i))
+        rep = dict(tweets[best])
+        if rep.get("retweet_user"):
+            rep["user"] = rep["retweet_user"]
+        users = []
+        for i in members:
+            for user in (tweets[i].get("retweet_user"), tweets[i]["user"]):
+                if user and user not in users:
+                    users.append(user)
+        rep["echo_count"] = max(1, len(users))  # 投稿数ではなくアカウント数（同じ人の連投・自分のRTは数えない）
+        rep["echo_users"] = [u for u in users if u != rep["user"]]
+        collapsed.append(rep)
+
+    collapsed.sort(key=lambda t: t["created_at"])
+    return collapsed
+
+
+# --- プロンプト圧縮 ---
+
+def estimate_tokens(text):
+    """おおよそのトークン数（ASCIIは4文字≒1トークン、日本語などは1文字≒1トークン）"""
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars)
+
+
+def relative_time(ts, ref):
+    """ref（最新の投稿時刻）からの経過を短く表す: 0m / 45m / 3h / 2d"""
+    minutes = max(0, int(ref - ts) // 60)
+    if minutes < 60:
+        return f"{minutes}m"
+    if minutes < 48 * 60:
+        return f"{minutes // 60}h"
+    return f"{minutes // 1440}d"
+
+
+def compact_text(text):
+    """URL は 🔗 に、RT接頭辞・先頭の返信先・末尾のハッシュタグ列は削除、改行は詰める"""
+    text = RT_PREFIX_RE.sub("", text)
+    text = LEADING_MENTIONS_RE.sub("", text)
+    tail = TRAILING_TAGS_RE.search(text)
+    if tail:
+        text = text[:tail.start()]
+    text = URL_RE.sub("🔗", text)
+    if tail and URL_RE.search(tail.group(0)):
+        text += " 🔗"
+    return " ".join(text.split())
+
+
+def link_text(link):
+    """展開済みのリンクを短く: 🔗「タイトル」概要"""
+    text = f"🔗「{link['title']}」"
+    description = link.get("description") or ""
+    return text if not description or description.startswith(link["title"]) else text + description
+
+
+def format_tweet(tweet, ref):
+    """1件を1行に整形: @user(3h)［5件共有］: 本文（リンクを展開済みなら 🔗 の代わりにタイトルと概要）"""
+    header = f"@{tweet['user']}({relative_time(tweet['created_at'], ref)})"
+    if tweet.get("echo_count", 1) > 1:
+        header += f"［{tweet['echo_count']}件共有］"
+    text = compact_text(tweet["text"])
+    if tweet.get("links"):
+        text = " ".join([" ".join(text.replace("🔗", " ").split())] + [link_text(link) for link in tweet["links"]])
+    return f"{header}: {text}"
+
+
+def priority(tweet, ref):
+    """残す優先度: 反応数と共有数が多いほど高く、古いほど低い"""
+    engagement = math.log1p(tweet["favorite_count"] + 2 * tweet["retweet_count"])
+    echo = 2 * math.log1p(tweet.get("echo_count", 1) - 1)
+    age_hours = (ref - tweet["created_at"]) / 3600
+    return engagement + echo - age_hours / 12
+
+
+def reference_time(tweets):
+    """相対時刻の基準（最新の投稿時刻）"""
+    return max(t["created_at"] for t in tweets)
+
+
+def format_batch(tweets, ref):
+    """整形・トークン推定・優先度をまとめて計算（プロセスプールでバッチ単位に実行）
+
+    戻り値: [(整形済みの行, 推定トークン, 優先度)]
+    """
+    out = []
+    for t in tweets:
+        line = format_tweet(t, ref)
+        out.append((line, estimate_tokens(line), priority(t, ref)))
+    return out
+
+
+def compact_tweets(tweets, budget, formatted=None):
+    """ツイートを短い1行形式に整形し、推定トークンが budget 以下になるよう優先度順に選ぶ
+
+    時刻は最新の投稿からの相対表記（実行時刻に依存しないため要約キャッシュが効く）。
+    formatted: 計算済みの format_batch() の結果（並列処理用、省略時はここで計算）
+    戻り値: 整形済みの行のリスト（投稿日時順）
+    """
+    if not tweets:
+        return []
+    if formatted is None:
+        formatted = format_batch(tweets, reference_time(tweets))
+    lines = [(line, tokens, score, t["created_at"]) for (line, tokens, score), t in zip(formatted, tweets)]
+    if budget and sum(tokens for _, tokens, _, _ in lines) > budget:
+        kept = []
+        used = 0
+        for item in sorted(lines, key=lambda item: item[2], reverse=True):
+            if used + item[1] > budget:
+                continue
+            kept.append(item)
+            used += item[1]
+        lines = sorted(kept, key=lambda item: item[3])
+    return [line for line, _, _, _ in lines]
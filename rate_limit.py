@@ -0,0 +1,275 @@
+"""
+X API のレート制限に合わせたリクエストの間隔調整（トークンバケット）
+
+X はエンドポイントごとに「15分あたりN回」の上限があり、応答ヘッダー
+（x-rate-limit-limit / -remaining / -reset）で残り回数と解除時刻を返す。
+twikit の httpx クライアントにイベントフックを付け、
+- 応答のヘッダーからエンドポイントごとの上限・残り回数・解除時刻を記録し、
+- リクエストの前に、上限を超えないペースになるまで待つ
+  （トークンは 上限/15分 の速さで補充し、サーバーが返した残り回数より多くは使わない）。
+上限に当たってからリトライで待つより全体として速く、エラーも出ない。
+状態は .rate_limit.json に保存するため、続けて実行しても前回の消費を引き継ぐ。
+"""
+import asyncio
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_FILE = os.path.join(SCRIPT_DIR, ".rate_limit.json")
+
+WINDOW = 15 * 60  # X のレート制限の単位時間（秒）
+BURST_RATIO = 0.2  # 続けて送れる回数（上限に対する割合。それ以上は補充のペースで送る）
+RESERVE = 1  # 時計のずれなどに備えて使わずに残しておく回数
+NOTICE_SECONDS = 5  # これ以上待つときはログを出す
+SAVE_INTERVAL = 1.0  # 状態ファイルを書き込む最短の間隔（秒）
+INFLIGHT_TTL = 120  # 応答が返らないリクエスト（通信エラーなど）を送信中とみなすのをやめるまでの秒数
+
+# wait_for で実行中の処理がレート制限で待った秒数（タイムアウトの計算から除く）
+_paused = contextvars.ContextVar("rate_limit_paused", default=None)
+
+
+class TokenBucket:
+    """1エンドポイント分の上限と残り回数"""
+
+    def __init__(self, limit, tokens=None, updated=None, remaining=None, reset=0):
+        self.limit = limit
+        self.tokens = self.capacity if tokens is None else tokens
+        self.updated = updated or time.time()
+        self.remaining = remaining  # サーバーが返した残り回数（解除時刻を過ぎたら None）
+        self.reset = reset
+
+    @property
+    def capacity(self):
+        return max(1.0, self.limit * BURST_RATIO)
+
+    @property
+    def rate(self):
+        return self.limit / WINDOW
+
+    def _refill(self, at):
+        if at > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (at - self.updated) * self.rate)
+            self.updated = at
+        if self.reset and at >= self.reset:
+            self.remaining = None
+            self.reset = 0
+        if self.remaining is not None:
+            self.tokens = min(self.tokens, self.remaining)
+
+    def reserve(self, now):
+        """1回分を予約し、送信まで待つべき秒数を返す"""
+        self._refill(now)
+        self.tokens -= 1
+        wait = max(0.0, -self.tokens) / self.rate
+        if self.remaining is not None:
+            self.remaining -= 1
+            if self.remaining < 0:
+                # 今の窓の残り回数を使い切ったら、解除時刻以降に補充のペースで送る
+                wait = max(wait, self.reset - now + (-self.remaining - 1) / self.rate)
+        return wait
+
+    def refund(self):
+        """予約したのに送らなかった1回分を戻す"""
+        self.tokens = min(self.capacity, self.tokens + 1)
+        if self.remaining is not None:
+            self.remaining += 1
+
+    def update(self, limit, remaining, reset, now, inflight=0):
+        """応答ヘッダーの値で上限・残り回数・解除時刻を更新
+
+        inflight: まだ応答が返っていないリクエスト数（サーバーの残り回数にまだ反映されていない分）
+        """
+        self._refill(now)
+        self.limit = limit
+        self.remaining = max(0, remaining - inflight - RESERVE)
+        self.reset = reset
+        self.tokens = min(self.tokens, self.remaining)
+
+    def to_dict(self):
+        return {"limit": self.limit, "tokens": round(self.tokens, 3), "updated": self.updated,
+                "remaining": self.remaining, "reset": self.reset}
+
+
+class RateLimiter:
+    """エンドポイントごとのトークンバケット（twikit のクライアントをまたいで共有）"""
+
+    def __init__(self, path=None):
+        self.path = path or STATE_FILE
+        self.buckets = {}
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self._lock = threading.Lock()
+        self._saved = 0.0
+        self._dirty = False
+        self._mtime = None
+        self._inflight = {}  # エンドポイント → 送信した（応答待ちの）リクエストの時刻
+        self._noticed = {}  # エンドポイント → 待機のログを出した待ち終わりの時刻（同じ待ちで何度も出さない）
+        self._load()
+
+    def _load(self):
+        try:
+            self._mtime = os.path.getmtime(self.path)
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.buckets = {name: TokenBucket(**state) for name, state in data.items()}
+        except (OSError, ValueError, TypeError):
+            self.buckets = {}
+
+    def refresh(self):
+        """ほかのプロセス（main.py と設定画面）が状態を更新していたら読み直す"""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        with self._lock:
+            if mtime != self._mtime and not self._dirty:
+                self._load()
+
+    def save(self):
+        """状態を保存（変更がなければ何もしない）"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {name: bucket.to_dict() for name, bucket in self.buckets.items()}
+            self._dirty = False
+            self._saved = time.time()
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.path)
+            self._mtime = os.path.getmtime(self.path)
+        except OSError as e:
+            print(f"  ⚠️ レート制限の状態を保存できませんでした: {e}")
+
+    @staticmethod
+    def endpoint(url):
+        """URL からエンドポイント名（GraphQL なら ListLatestTweetsTimeline など）"""
+        return url.path.rstrip("/").rsplit("/", 1)[-1]
+
+    def _inflight_times(self, endpoint, now):
+        times = self._inflight.setdefault(endpoint, deque())
+        while times and now - times[0] > INFLIGHT_TTL:
+            times.popleft()
+        return times
+
+    def reserve(self, endpoint):
+        """送信まで待つべき秒数（上限が分かっていないエンドポイントは待たない）"""
+        with self._lock:
+            self._inflight_times(endpoint, time.time()).append(time.time())
+            bucket = self.buckets.get(endpoint)
+            if bucket is None:
+                return 0.0
+            wait = bucket.reserve(time.time())
+            self._dirty = True
+            if wait > 0:
+                self.waits += 1
+                self.wait_seconds += wait
+            return wait
+
+    def cancel(self, endpoint):
+        """待機中に取り消されたリクエストの予約を戻す"""
+        with self._lock:
+            inflight = self._inflight_times(endpoint, time.time())
+            if inflight:
+                inflight.pop()
+            bucket = self.buckets.get(endpoint)
+            if bucket is not None:
+                bucket.refund()
+                self._dirty = True
+
+    def update(self, endpoint, headers):
+        """応答を受け取ったら呼ぶ。ヘッダーに上限の情報があれば記録"""
+        now = time.time()
+        with self._lock:
+            inflight = self._inflight_times(endpoint, now)
+            if inflight:
+                inflight.popleft()
+        try:
+            limit = int(headers["x-rate-limit-limit"])
+            remaining = int(headers["x-rate-limit-remaining"])
+            reset = float(headers["x-rate-limit-reset"])
+        except (KeyError, ValueError):
+            return
+        with self._lock:
+            bucket = self.buckets.get(endpoint)
+            if bucket is None:
+                bucket = self.buckets[endpoint] = TokenBucket(limit, updated=now)
+            bucket.update(limit, remaining, reset, now, len(inflight))
+            self._dirty = True
+            due = now - self._saved >= SAVE_INTERVAL
+        if due:
+            self.save()
+
+    async def before_request(self, request):
+        endpoint = self.endpoint(request.url)
+        wait = self.reserve(endpoint)
+        now = time.time()
+        if wait >= NOTICE_SECONDS and now >= self._noticed.get(endpoint, 0):
+            self._noticed[endpoint] = now + wait
+            print(f"  ⏳ X のレート制限に合わせて {endpoint} を{wait:.0f}秒待機")
+        if wait > 0:
+            paused = _paused.get()
+            if paused is not None:
+                paused[0] += wait
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self.cancel(endpoint)
+                raise
+
+    async def after_response(self, response):
+        self.update(self.endpoint(response.request.url), response.headers)
+
+    def attach(self, client):
+        """twikit の Client（の httpx.AsyncClient）にフックを付ける"""
+        self.refresh()
+        hooks = client.http.event_hooks
+        hooks["request"] = [*hooks.get("request", []), self.before_request]
+        hooks["response"] = [*hooks.get("response", []), self.after_response]
+        client.http.event_hooks = hooks
+        return client
+
+
+async def wait_for(aw, timeout):
+    """asyncio.wait_for と同じだが、レート制限に合わせて待った時間は timeout に数えない"""
+    loop = asyncio.get_running_loop()
+    paused = [0.0]
+    token = _paused.set(paused)
+    try:
+        task = asyncio.ensure_future(aw)  # タスクは作成時のコンテキスト（paused）を引き継ぐ
+    finally:
+        _paused.reset(token)
+    deadline = loop.time() + timeout
+    try:
+        while True:
+            remaining = deadline + paused[0] - loop.time()
+            if remaining <= 0:
+                break
+            done, _ = await asyncio.wait({task}, timeout=remaining)
+            if done:
+                return task.result()
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    raise asyncio.TimeoutError()
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared():
+    """プロセス内で共有する RateLimiter（初回に状態ファイルを読み込み、終了時に保存）"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = RateLimiter()
+            atexit.register(_shared.save)
+        return _shared
@@ -0,0 +1,118 @@
+"""
+取得・要約・送信で共通のリトライ処理
+
+指数バックオフ＋ジッターで待機し、サーバーが待ち時間を返した場合
+（Retry-After ヘッダー、X の x-rate-limit-reset、Gemini の retryDelay）はそれに従う。
+待機は asyncio.sleep なので、待っている間も他のリストの取得などは進む。
+"""
+import asyncio
+import random
+import re
+import time
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RETRYABLE_NAMES = {"TooManyRequests", "ServerError", "RequestTimeout", "TransportError", "TimeoutException"}
+
+
+class RetryStats:
+    """リトライ回数と待機時間の合計（ログ・計測用）"""
+
+    def __init__(self):
+        self.retries = 0
+        self.wait_seconds = 0.0
+
+
+stats = RetryStats()
+
+
+def _status_code(exc):
+    for attr in ("code", "status_code", "smtp_code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(exc, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def _parse_seconds(value):
+    """'35s' / '1.5' / '120' のような値を秒数に変換"""
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)s?\s*$", str(value))
+    return float(match.group(1)) if match else None
+
+
+def retry_after(exc):
+    """サーバーが指定した待ち時間（秒）。指定がなければNone"""
+    # X (twikit): レート制限の解除時刻 (UNIX秒)
+    reset = getattr(exc, "rate_limit_reset", None)
+    if reset:
+        return max(0.0, reset - time.time())
+
+    # Retry-After ヘッダー
+    headers = getattr(exc, "headers", None) or getattr(getattr(exc, "response", None), "headers", None)
+    if headers:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        if value is not None:
+            return _parse_seconds(value)
+
+    # Gemini: error.details[].retryDelay (google.rpc.RetryInfo)
+    details = getattr(exc, "details", None)
+    if isinstance(details, dict):
+        for detail in details.get("error", {}).get("details", []) or []:
+            if isinstance(detail, dict) and "retryDelay" in detail:
+                return _parse_seconds(detail["retryDelay"])
+    return None
+
+
+def is_retryable(exc):
+    """一時的なエラー（待てば回復する見込みがある）ならTrue"""
+    import smtplib
+    if isinstance(exc, smtplib.SMTPAuthenticationError):
+        return False
+    if isinstance(exc, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        # 宛先ごとの応答コード。すべて一時的な拒否（4xx）ならリトライ
+        codes = [code for code, _ in exc.recipients.values()]
+        return bool(codes) and all(400 <= code < 500 for code in codes)
+    if isinstance(exc, smtplib.SMTPException):
+        # 応答コードのないSMTPのエラー（STARTTLS非対応など）は設定の問題なので待っても直らない
+        return False
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError, TimeoutError)):
+        return True
+    if any(cls.__name__ in RETRYABLE_NAMES for cls in type(exc).__mro__):
+        return True
+    code = _status_code(exc)
+    if code is not None:
+        return code in RETRYABLE_STATUS
+    return isinstance(exc, OSError)
+
+
+def backoff_delay(attempt, base_delay, max_delay):
+    """指数バックオフ（フルジッター）"""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+async def retry_async(func, *args, label="", attempts=4, base_delay=2.0, max_delay=120.0, **kwargs):
+    """func(*args, **kwargs) を実行し、一時的なエラーなら待ってから再実行する
+
+    func はコルーチン関数。致命的なエラーや最終試行の失敗はそのまま送出する。
+    """
+    for attempt in range(attempts):
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            if attempt >= attempts - 1 or not is_retryable(e):
+                raise
+            hint = retry_after(e)
+            if hint is not None:
+                # サーバー指定の待ち時間に少しだけジッターを足す（上限は max_delay の数倍まで）
+                wait = min(hint, max_delay * 5) + random.uniform(0, 1)
+            else:
+                wait = backoff_delay(attempt, base_delay, max_delay)
+            stats.retries += 1
+            stats.wait_seconds += wait
+            print(f"  ⏳ {label}: {type(e).__name__}。{wait:.1f}秒待機してリトライ... ({attempt+1}/{attempts})")
+            await asyncio.sleep(wait)
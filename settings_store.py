@@ -0,0 +1,225 @@
+"""
+settings.json の読み書き（main.py と web_settings.py で共用）
+
+- 読み込みは更新日時とサイズが変わらない限りメモリ上のキャッシュを返す
+- 書き込みは一時ファイルに書いてから置き換えるため、読み込み側が書きかけのファイルを読むことはない
+- 同時に保存されたときのためにロックファイルで排他する
+- 保存・読み込み時に値の型と範囲を検証する
+"""
+import copy
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SETTINGS_FILE = os.path.join(SCRIPT_DIR, "settings.json")
+LOCK_FILE = SETTINGS_FILE + ".lock"
+
+DEFAULTS = {
+    "list_urls": [],
+    "gemini_api_key": "",
+    "gmail_user": "",
+    "gmail_app_password": "",
+    "schedule_time": "07:00",
+    "x_cookies": {"auth_token": "", "ct0": "", "twid": ""},
+    "fetch_concurrency": 4,
+    "fetch_timeout": 120,
+    "max_pages": 50,
+    "first_run_hours": 24,
+    "store_retention_days": 30,
+    "summary_chunk_tokens": 30000,
+    "summary_concurrency": 2,
+    "summary_batch_tokens": 60000,  # 複数の宛先グループの要約を1回のリクエストにまとめる上限（0 ならまとめない）
+    "summary_cache_entries": 100,
+    "summary_cache_days": 7,
+    "retry_attempts": 4,
+    "retry_max_delay": 120,
+    "stream_summary": False,
+    "dedupe_threshold": 0.7,
+    "prompt_token_budget": 100000,
+    "smtp_host": "smtp.gmail.com",
+    "smtp_port": 465,
+    "smtp_ssl": True,
+    "smtp_allow_plaintext": False,
+    "smtp_batch_size": 50,
+    "incremental_hours": 0,  # 常駐モードで途中経過を作る間隔（0 なら作らない）
+    "preprocess_workers": 0,  # 前処理のプロセス数（0 ならCPUコア数、1 なら並列化しない）
+    "enrich_links": False,  # リンク先のタイトル・概要を取得してプロンプトに添える
+    "link_concurrency": 16,
+    "link_timeout": 10,
+    "link_cache_days": 7,
+    # 宛先: "メールアドレス" または {"email": ..., "lists": [リストURL/ID, ...]}（空なら gmail_user 宛て）
+    "recipients": [],
+}
+
+# キー: (型, 最小値, 最大値)  ※範囲は数値のみ
+SCHEMA = {
+    "list_urls": (list, None, None),
+    "gemini_api_key": (str, None, None),
+    "gmail_user": (str, None, None),
+    "gmail_app_password": (str, None, None),
+    "schedule_time": (str, None, None),
+    "x_cookies": (dict, None, None),
+    "fetch_concurrency": (int, 1, 64),
+    "fetch_timeout": (int, 1, 3600),
+    "max_pages": (int, 1, 1000),
+    "first_run_hours": (int, 1, 24 * 30),
+    "store_retention_days": (int, 1, 3650),
+    "summary_chunk_tokens": (int, 1000, 1000000),
+    "summary_concurrency": (int, 1, 16),
+    "summary_batch_tokens": (int, 0, 1000000),
+    "summary_cache_entries": (int, 0, 100000),
+    "summary_cache_days": (int, 0, 3650),
+    "retry_attempts": (int, 1, 20),
+    "retry_max_delay": ((int, float), 0, 3600),
+    "stream_summary": (bool, None, None),
+    "dedupe_threshold": ((int, float), 0, 1),
+    "prompt_token_budget": (int, 0, 2000000),
+    "smtp_host": (str, None, None),
+    "smtp_port": (int, 1, 65535),
+    "smtp_ssl": (bool, None, None),
+    "smtp_allow_plaintext": (bool, None, None),
+    "smtp_batch_size": (int, 1, 1000),
+    "incremental_hours": (int, 0, 24),
+    "preprocess_workers": (int, 0, 64),
+    "enrich_links": (bool, None, None),
+    "link_concurrency": (int, 1, 64),
+    "link_timeout": (int, 1, 120),
+    "link_cache_days": (int, 0, 365),
+    "recipients": (list, None, None),
+}
+
+SCHEDULE_TIME_RE = re.compile(r"^([01]\d|2[0-3]):[0-5]\d$")
+
+
+class SettingsError(ValueError):
+    """settings.json の内容が不正"""
+
+
+_cache = {"key": None, "data": None}
+_cache_lock = threading.Lock()
+
+
+def validate(data):
+    """型と範囲をチェックし、問題があれば SettingsError を送出（ほかの例外は出さない）"""
+    errors = []
+    invalid = set()
+    for key, (types, lo, hi) in SCHEMA.items():
+        if key not in data:
+            continue
+        value = data[key]
+        # bool は int のサブクラスなので数値項目では弾く
+        if not isinstance(value, types) or (isinstance(value, bool) and types is not bool):
+            errors.append(f"{key}: 型が不正です ({type(value).__name__})")
+            invalid.add(key)
+            continue
+        if lo is not None and not lo <= value <= hi:
+            errors.append(f"{key}: {lo}〜{hi} の範囲で指定してください ({value})")
+
+    def checked(key, default):
+        # 型が不正な項目はエラーを記録済みなので、中身のチェックは飛ばす
+        return default if key in invalid else data.get(key, default)
+
+    if not all(isinstance(url, str) for url in checked("list_urls", [])):
+        errors.append("list_urls: 文字列のリストで指定してください")
+    if not all(isinstance(v, str) for v in checked("x_cookies", {}).values()):
+        errors.append("x_cookies: 値は文字列で指定してください")
+    for recipient in checked("recipients", []):
+        if isinstance(recipient, dict):
+            email, lists = recipient.get("email"), recipient.get("lists", [])
+        else:
+            email, lists = recipient, []
+        if not isinstance(email, str) or "@" not in email or \
+                not isinstance(lists, list) or not all(isinstance(v, str) for v in lists):
+            errors.append(f"recipients: 宛先の形式が不正です ({recipient})")
+    if "schedule_time" in data and "schedule_time" not in invalid \
+            and not SCHEDULE_TIME_RE.match(data["schedule_time"]):
+        errors.append(f"schedule_time: HH:MM 形式で指定してください ({data['schedule_time']})")
+    if errors:
+        raise SettingsError("settings.json の内容が不正です: " + " / ".join(errors))
+
+
+def _normalize(data):
+    """初期値を補い、旧形式（list_url 1件）を list_urls に移行"""
+    settings = copy.deepcopy(DEFAULTS)
+    settings.update(data)
+    if not settings["list_urls"] and settings.get("list_url"):
+        settings["list_urls"] = [settings["list_url"]]
+    settings.pop("list_url", None)
+    return settings
+
+
+def exists():
+    return os.path.exists(SETTINGS_FILE)
+
+
+def settings_mtime():
+    try:
+        return os.path.getmtime(SETTINGS_FILE)
+    except OSError:
+        return None
+
+
+def load_settings():
+    """設定を読み込む（ファイルがなければ初期値）。ファイルが変わっていなければキャッシュを返す"""
+    try:
+        st = os.stat(SETTINGS_FILE)
+    except FileNotFoundError:
+        return copy.deepcopy(DEFAULTS)
+    key = (st.st_mtime_ns, st.st_size)
+    with _cache_lock:
+        if _cache["key"] != key:
+            with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise SettingsError("settings.json の内容が不正です: オブジェクト（{...}）で指定してください")
+            settings = _normalize(data)
+            validate(settings)
+            _cache["key"], _cache["data"] = key, settings
+        return copy.deepcopy(_cache["data"])
+
+
+@contextmanager
+def _file_lock():
+    """ロックファイルで書き込みを排他（別プロセス間でも有効）"""
+    with open(LOCK_FILE, "a+b") as f:
+        if sys.platform == "win32":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def save_settings(data):
+    """検証してから一時ファイル経由で置き換え保存"""
+    settings = _normalize(data)
+    validate(settings)
+    with _file_lock():
+        fd, tmp_path = tempfile.mkstemp(dir=SCRIPT_DIR, prefix=".settings-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(settings, f, indent=4, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, SETTINGS_FILE)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    with _cache_lock:
+        _cache["key"] = None
@@ -0,0 +1,82 @@
+"""
+要約結果のキャッシュ
+
+ツイート一式・プロンプトテンプレート・モデル名のハッシュをキーに要約を保存し、
+同じ内容で再実行したとき（再送信・SMTP失敗後のリトライなど）は Gemini を呼ばずに返す。
+"""
+import hashlib
+import json
+import os
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(SCRIPT_DIR, ".summary_cache")
+
+
+def make_key(entries, template, model, extra=""):
+    """ツイート一式（順不同・空白の違いは無視）、テンプレート、モデル名からキーを作る"""
+    h = hashlib.sha256()
+    for part in (model, template, extra):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    for entry in sorted(" ".join(e.split()) for e in entries):
+        h.update(entry.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class SummaryCache:
+    """件数・経過日数で古いものから削除するファイルキャッシュ"""
+
+    def __init__(self, cache_dir=None, max_entries=100, max_age_days=7):
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """キャッシュ済みの要約を返す（なければNone）"""
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                raise FileNotFoundError(path)
+            with open(path, "r", encoding="utf-8") as f:
+                summary = json.load(f)["summary"]
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return summary
+
+    def put(self, key, summary):
+        """要約を保存して、上限を超えた古いエントリを削除"""
+        tmp_path = self._path(key) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "summary": summary}, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path(key))
+        self.evict()
+
+    def evict(self):
+        now = time.time()
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            mtime = os.path.getmtime(path)
+            if now - mtime > self.max_age:
+                os.remove(path)
+            else:
+                files.append((mtime, path))
+        files.sort(reverse=True)
+        for _, path in files[self.max_entries:]:
+            os.remove(path)
+
+    def stats(self):
+        return f"ヒット{self.hits}件 / ミス{self.misses}件"
@@ -0,0 +1,194 @@
+"""
+取得したツイートのローカル保存先 (SQLite)
+
+ツイートIDを主キーにして保存するため、複数リスト・複数回の取得で
+同じツイートが重複しない。要約時は期間を指定して読み出す。
+日中の途中経過（部分要約）も、次の送信でまとめるまでここに保存する。
+"""
+import json
+import os
+import sqlite3
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_FILE = os.path.join(SCRIPT_DIR, "tweets.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tweets (
+    id INTEGER PRIMARY KEY,
+    user TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    favorite_count INTEGER NOT NULL DEFAULT 0,
+    retweet_count INTEGER NOT NULL DEFAULT 0,
+    fetched_at INTEGER NOT NULL,
+    retweet_of INTEGER,
+    retweet_user TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_tweets_created_at ON tweets (created_at);
+
+CREATE TABLE IF NOT EXISTS list_tweets (
+    list_id TEXT NOT NULL,
+    tweet_id INTEGER NOT NULL,
+    PRIMARY KEY (list_id, tweet_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_list_tweets_tweet_id ON list_tweets (tweet_id);
+
+CREATE TABLE IF NOT EXISTS partials (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    group_key TEXT NOT NULL,
+    since INTEGER NOT NULL,
+    until INTEGER NOT NULL,
+    summary TEXT NOT NULL,
+    tweet_count INTEGER NOT NULL DEFAULT 0,
+    marks TEXT NOT NULL,
+    created_at INTEGER NOT NULL
+);
+"""
+
+
+class TweetRecord:
+    """取得したツイートのうち保存に使う項目だけを持つ軽い記録
+
+    twikit の Tweet は GraphQL の応答全体（ユーザー情報・エンティティなど）を抱えており、
+    1件あたり数十KBになる。取得したページはすぐこの形に変換して手放す。
+    リツイートは元ツイートの本文・反応数・ID・投稿者を持つ（重複集約用）。
+    """
+
+    __slots__ = ("id", "user", "created_at", "text", "favorite_count", "retweet_count",
+                 "retweet_of", "retweet_user")
+
+    def __init__(self, id, user, created_at, text, favorite_count=0, retweet_count=0,
+                 retweet_of=None, retweet_user=None):
+        self.id = id
+        self.user = user
+        self.created_at = created_at  # UNIX秒
+        self.text = text
+        self.favorite_count = favorite_count
+        self.retweet_count = retweet_count
+        self.retweet_of = retweet_of
+        self.retweet_user = retweet_user
+
+    @classmethod
+    def from_twikit(cls, tweet):
+        rt = getattr(tweet, "retweeted_tweet", None)
+        src = rt or tweet
+        return cls(
+            int(tweet.id), tweet.user.screen_name, int(tweet.created_at_datetime.timestamp()),
+            src.text, src.favorite_count or 0, src.retweet_count or 0,
+            int(rt.id) if rt else None, rt.user.screen_name if rt else None,
+        )
+
+
+class TweetStore:
+    """ツイートIDで重複排除するSQLiteストア"""
+
+    def __init__(self, path=None):
+        self.conn = sqlite3.connect(path or DB_FILE)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """古い tweets.db に後から追加した列を足す"""
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(tweets)")}
+        for name, decl in (("retweet_of", "INTEGER"), ("retweet_user", "TEXT")):
+            if name not in columns:
+                self.conn.execute(f"ALTER TABLE tweets ADD COLUMN {name} {decl}")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_tweets(self, list_id, tweets):
+        """TweetRecord をまとめて保存（保存済みのIDは無視）し、新規件数を返す"""
+        now = int(time.time())
+        rows = [
+            (t.id, t.user, t.created_at, t.text, t.favorite_count, t.retweet_count, now,
+             t.retweet_of, t.retweet_user)
+            for t in tweets
+        ]
+        with self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO tweets"
+                " (id, user, created_at, text, favorite_count, retweet_count, fetched_at,"
+                " retweet_of, retweet_user)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            added = self.conn.total_changes - before
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO list_tweets (list_id, tweet_id) VALUES (?, ?)",
+                [(list_id, row[0]) for row in rows]
+            )
+        return added
+
+    def get_window(self, list_ids, since, until=None, fetched_after=0):
+        """指定リストの since〜until (UNIX秒) に投稿されたツイートを古い順に返す
+
+        since: 全リスト共通の開始時刻、または {リストID: 開始時刻}（リストごとの取得位置から読む。
+               動きの少ないリストの古い位置に、ほかのリストの送信済みの投稿まで引きずられない）
+        fetched_after を指定すると、その時刻より後に取得したものだけ（途中経過の続きを読む用）。
+        """
+        until = until or int(time.time())
+        starts = since if isinstance(since, dict) else dict.fromkeys(list_ids, since)
+        starts = {list_id: int(starts[list_id]) for list_id in list_ids}
+        conditions = " OR ".join(["(list_id = ? AND tweets.created_at > ?)"] * len(starts))
+        return self.conn.execute(
+            "SELECT * FROM tweets WHERE created_at > ? AND created_at <= ? AND fetched_at > ?"
+            " AND EXISTS (SELECT 1 FROM list_tweets WHERE tweet_id = tweets.id"
+            f" AND ({conditions}))"
+            " ORDER BY created_at",
+            [min(starts.values(), default=0), int(until), int(fetched_after),
+             *(value for item in starts.items() for value in item)]
+        ).fetchall()
+
+    def prune(self, days):
+        """days 日より古いツイートを削除"""
+        cutoff = int(time.time()) - days * 86400
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM list_tweets WHERE tweet_id IN"
+                " (SELECT id FROM tweets WHERE created_at < ?)", (cutoff,)
+            )
+            self.conn.execute("DELETE FROM tweets WHERE created_at < ?", (cutoff,))
+
+    # --- 途中経過（部分要約） ---
+
+    def add_partial(self, group_key, since, until, summary, tweet_count, marks):
+        """since〜until（取得時刻）に取得したツイートの部分要約と、その時点の取得位置を保存"""
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO partials (group_key, since, until, summary, tweet_count, marks, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (group_key, int(since), int(until), summary, tweet_count,
+                 json.dumps(marks, ensure_ascii=False), int(time.time()))
+            )
+
+    def get_partials(self, group_key):
+        """まだ送信していない部分要約（古い順）"""
+        return self.conn.execute(
+            "SELECT * FROM partials WHERE group_key = ? ORDER BY until", (group_key,)
+        ).fetchall()
+
+    def latest_partial(self):
+        """最後に保存した部分要約（なければ None）"""
+        return self.conn.execute("SELECT * FROM partials ORDER BY id DESC LIMIT 1").fetchone()
+
+    def partial_marks(self):
+        """最後の途中経過の時点の取得位置 {リストID: ウォーターマーク}"""
+        row = self.latest_partial()
+        return json.loads(row["marks"]) if row else {}
+
+    def clear_partials(self):
+        """送信した要約に含めた部分要約を削除"""
+        with self.conn:
+            self.conn.execute("DELETE FROM partials")
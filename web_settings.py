@@ -5,36 +5,24 @@ http://localhost:5000 で設定画面を開く
 import json
 import os
 import asyncio
-from flask import Flask, render_template_string, request, redirect, url_for, flash, jsonify
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Flask, Response, render_template_string, request, redirect, url_for, flash, stream_with_context
+import metrics
+import outbox
+import rate_limit
+from settings_store import DEFAULTS, SettingsError, load_settings, save_settings
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-SETTINGS_FILE = os.path.join(SCRIPT_DIR, "settings.json")
 
 app = Flask(__name__)
 app.secret_key = "x_summary_local_key"
 
 
-def load_settings():
-    defaults = {
-        "list_url": "",
-        "gemini_api_key": "",
-        "gmail_user": "",
-        "gmail_app_password": "",
-        "schedule_time": "07:00",
-        "x_cookies": {"auth_token": "", "ct0": "", "twid": ""}
-    }
-    if os.path.exists(SETTINGS_FILE):
-        with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            defaults.update(data)
-    return defaults
-
-
-def save_settings(data):
-    with open(SETTINGS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
-
-
 # --- 共通CSS ---
 
 COMMON_CSS = """
@@ -66,7 +54,7 @@ HTML_TEMPLATE = (
 .field { margin-bottom: 16px; }
 .field-header { display: flex; align-items: center; gap: 6px; margin-bottom: 6px; }
 .field-header label { font-size: 14px; color: #71767b; }
-.field input[type="text"], .field input[type="password"] {
+.field input[type="text"], .field input[type="password"], .field input[type="number"], .field textarea {
     width: 100%; padding: 12px 16px; background: #202327; border: 1px solid #333639;
     border-radius: 8px; color: #e7e9ea; font-size: 15px;
     font-family: 'Consolas', 'Courier New', monospace; transition: border-color 0.2s;
@@ -89,7 +77,20 @@ HTML_TEMPLATE = (
 .dot-green { background: #00ba7c; } .dot-red { background: #f4212e; } .dot-yellow { background: #ffd400; }
 .toggle-pw { cursor: pointer; color: #71767b; font-size: 12px; user-select: none; }
 .toggle-pw:hover { color: #1d9bf0; }
+.chart { margin-top: 16px; }
+.chart h3 { font-size: 13px; color: #71767b; font-weight: 400; margin-bottom: 8px; }
+.chart svg { width: 100%; height: auto; display: block; }
+.legend { display: flex; gap: 12px; font-size: 12px; color: #71767b; margin-top: 6px; }
+.legend span::before { content: ''; display: inline-block; width: 10px; height: 10px; border-radius: 2px; margin-right: 4px; background: var(--c); }
 #testResult { margin-top: 12px; padding: 12px; border-radius: 8px; font-size: 13px; font-family: monospace; white-space: pre-wrap; display: none; }
+#runBtn:disabled { opacity: 0.6; cursor: default; }
+#runStatus { font-size: 13px; color: #71767b; margin-top: 12px; }
+.run-stages { width: 100%; border-collapse: collapse; font-size: 13px; margin-top: 12px; }
+.run-stages td { padding: 6px 8px; border-bottom: 1px solid #2f3336; vertical-align: top; }
+.run-stages td.sec { text-align: right; font-family: monospace; white-space: nowrap; }
+.run-stages tr.active td { color: #1d9bf0; }
+.run-stages .counters { color: #71767b; font-size: 12px; }
+#runLog { margin-top: 12px; max-height: 240px; overflow-y: auto; padding: 12px; background: #202327; border-radius: 8px; font-size: 12px; white-space: pre-wrap; display: none; }
 """
 )
 
@@ -144,10 +145,18 @@ HTML_TEMPLATE += """
             <h2>📱 Xリスト</h2>
             <div class="field">
                 <div class="field-header">
-                    <label>リストURL</label>
-                    <span class="tip">？<span class="tip-box"><b>Xリストのアドレス</b><br>要約したいXリストのページURLです。Xでリストを開き、ブラウザのアドレスバーからコピーします。<br>形式: https://x.com/i/lists/数字</span></span>
+                    <label>リストURL（1行に1つ）</label>
+                    <span class="tip">？<span class="tip-box"><b>Xリストのアドレス</b><br>要約したいXリストのページURLです。Xでリストを開き、ブラウザのアドレスバーからコピーします。複数のリストは改行で区切って入力すると、まとめて1通の要約になります。<br>形式: https://x.com/i/lists/数字</span></span>
+                </div>
+                <textarea name="list_urls" rows="3" placeholder="例: https://x.com/i/lists/1234567890123456789">{{ s.list_urls | join('\\n') }}</textarea>
+            </div>
+            <div class="field">
+                <div class="field-header">
+                    <label>同時取得数 / タイムアウト(秒)</label>
+                    <span class="tip">？<span class="tip-box"><b>並行取得の設定</b><br>複数リストを同時に取得する上限数と、1リストあたりの取得時間の上限です（X のレート制限に合わせた待機時間は含みません）。通常は初期値のままで問題ありません。</span></span>
                 </div>
-                <input type="text" name="list_url" value="{{ s.list_url }}" placeholder="例: https://x.com/i/lists/1234567890123456789">
+                <input type="number" name="fetch_concurrency" value="{{ s.fetch_concurrency }}" min="1" max="16" style="width: 120px;">
+                <input type="number" name="fetch_timeout" value="{{ s.fetch_timeout }}" min="10" max="900" style="width: 120px;">
             </div>
         </div>
 
@@ -202,7 +211,7 @@ HTML_TEMPLATE += """
             <div class="field">
                 <div class="field-header">
                     <label>Gmailアドレス</label>
-                    <span class="tip">？<span class="tip-box"><b>送信元＆宛先の Gmail</b><br>要約メールの送信・受信に使う Gmail アドレスです。自分宛てに送信されます。</span></span>
+                    <span class="tip">？<span class="tip-box"><b>送信元＆宛先の Gmail</b><br>要約メールの送信に使う Gmail アドレスです。下の「送信先」が空欄なら自分宛てに送信されます。</span></span>
                 </div>
                 <input type="text" name="gmail_user" value="{{ s.gmail_user }}" placeholder="例: yourname@gmail.com">
             </div>
@@ -215,6 +224,13 @@ HTML_TEMPLATE += """
                 <span class="toggle-pw" onclick="togglePw('gmail_pw')">👁 表示/非表示</span>
                 <div class="hint"><a href="https://myaccount.google.com/apppasswords" target="_blank">Googleアプリパスワード</a> で発行</div>
             </div>
+            <div class="field">
+                <div class="field-header">
+                    <label>送信先（1行に1人、空欄なら自分宛て）</label>
+                    <span class="tip">？<span class="tip-box"><b>要約メールの送信先</b><br>チームなど複数人に送る場合に入力します。1行に1つメールアドレスを書きます。<br><br>特定のリストの要約だけを送りたい場合は、アドレスの後ろにスペース区切りでリストURL（またはリストID）を書きます。<br>例: taro@example.com https://x.com/i/lists/123</span></span>
+                </div>
+                <textarea name="recipients" rows="3" placeholder="例: taro@example.com&#10;hanako@example.com https://x.com/i/lists/1234567890123456789">{{ recipients_text }}</textarea>
+            </div>
         </div>
 
         <!-- 自動実行 -->
@@ -237,6 +253,14 @@ HTML_TEMPLATE += """
     </form>
 
     <div id="testResult"></div>
+
+    <div class="section" style="margin-top: 24px;">
+        <h2>▶ 今すぐ実行</h2>
+        <button type="button" class="btn btn-secondary" id="runBtn" onclick="startRun()">▶ 今すぐ実行</button>
+        <div id="runStatus">取得→要約→送信をバックグラウンドで実行し、段階ごとの進み具合と所要時間をここに表示します</div>
+        <table class="run-stages" id="runStages"></table>
+        <pre id="runLog"></pre>
+    </div>
 """
 
 # ステータス＆JS
@@ -249,7 +273,27 @@ HTML_TEMPLATE += """
             <div class="status-item"><span class="dot {{ 'dot-green' if s.gmail_app_password else 'dot-red' }}"></span> Gmail: {{ '設定済み' if s.gmail_app_password else '未設定' }}</div>
             <div class="status-item"><span class="dot {{ 'dot-green' if s.schedule_time else 'dot-yellow' }}"></span> 自動実行: {{ '毎日 ' + s.schedule_time if s.schedule_time else '未設定' }}</div>
             <div class="status-item"><span class="dot {{ 'dot-green' if last_run else 'dot-yellow' }}"></span> 最終実行: {{ last_run or '未実行' }}</div>
+            {% if outbox_items %}
+            <div class="status-item" title="{{ outbox_items[-1].data.last_error or '' }}"><span class="dot dot-yellow"></span> 送信待ち: {{ outbox_items|length }}件（次回の実行で再送）</div>
+            {% endif %}
         </div>
+        {% if chart.bars %}
+        <div class="chart">
+            <h3>⏱ 直近{{ chart.bars|length }}回の所要時間（最大 {{ '%.1f'|format(chart.max_seconds) }}秒）— <a href="/metrics" target="_blank">/metrics</a></h3>
+            <svg viewBox="0 0 {{ chart.width }} {{ chart.height }}" role="img">
+                {% for bar in chart.bars %}
+                <g><title>{{ bar.title }}</title>
+                {% for seg in bar.segments %}<rect x="{{ bar.x }}" y="{{ seg.y }}" width="{{ chart.bar_width }}" height="{{ seg.h }}" fill="{{ seg.color }}"></rect>{% endfor %}
+                {% if bar.failed %}<rect x="{{ bar.x }}" y="{{ chart.height - 3 }}" width="{{ chart.bar_width }}" height="3" fill="#f4212e"></rect>{% endif %}
+                </g>
+                {% endfor %}
+            </svg>
+            <div class="legend">
+                {% for label, color in chart.legend %}<span style="--c: {{ color }}">{{ label }}</span>{% endfor %}
+                <span style="--c: #f4212e">失敗</span>
+            </div>
+        </div>
+        {% endif %}
     </div>
 </div>
 <script>
@@ -258,15 +302,92 @@ async function runTest() {
     const box = document.getElementById('testResult');
     box.style.display = 'block';
     box.style.background = 'rgba(29,155,240,0.1)'; box.style.border = '1px solid rgba(29,155,240,0.3)'; box.style.color = '#1d9bf0';
-    box.textContent = '⏳ テスト実行中... (20〜30秒かかります)';
+    box.textContent = '⏳ テスト実行中... (X・Gemini・Gmail を同時にチェックしています)';
     try {
         const resp = await fetch('/test', { method: 'POST' });
-        const data = await resp.json();
-        if (data.success) { box.style.background = 'rgba(0,186,124,0.1)'; box.style.border = '1px solid rgba(0,186,124,0.3)'; box.style.color = '#00ba7c'; }
-        else { box.style.background = 'rgba(244,33,46,0.1)'; box.style.border = '1px solid rgba(244,33,46,0.3)'; box.style.color = '#f4212e'; }
-        box.textContent = data.message;
+        const reader = resp.body.getReader();
+        const decoder = new TextDecoder();
+        const lines = [];
+        let buf = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buf += decoder.decode(value, { stream: true });
+            let nl;
+            while ((nl = buf.indexOf('\\n')) >= 0) {
+                const data = JSON.parse(buf.slice(0, nl));
+                buf = buf.slice(nl + 1);
+                if (data.done) {
+                    if (data.success) { box.style.background = 'rgba(0,186,124,0.1)'; box.style.border = '1px solid rgba(0,186,124,0.3)'; box.style.color = '#00ba7c'; }
+                    else { box.style.background = 'rgba(244,33,46,0.1)'; box.style.border = '1px solid rgba(244,33,46,0.3)'; box.style.color = '#f4212e'; }
+                } else {
+                    lines.push(data.message);
+                    box.textContent = lines.join('\\n') + '\\n⏳ 残りのチェックを実行中...';
+                }
+            }
+        }
+        box.textContent = lines.join('\\n');
     } catch (e) { box.style.background = 'rgba(244,33,46,0.1)'; box.style.color = '#f4212e'; box.textContent = '❌ エラー: ' + e.message; }
 }
+const STAGE_LABELS = {{ stage_labels|tojson }};
+const STAGE_FIELDS = ['seconds', 'retries', 'retry_wait_seconds'];
+let runState = null;
+let runId = null;
+function renderRun() {
+    if (!runState) return;
+    const st = runState, p = st.progress || {}, running = st.status === 'running';
+    const now = Date.now() / 1000;
+    const btn = document.getElementById('runBtn');
+    btn.disabled = running;
+    btn.textContent = running ? '⏳ 実行中...' : '▶ 今すぐ実行';
+    const stageName = p.current ? (STAGE_LABELS[p.current] || p.current) : '';
+    document.getElementById('runStatus').textContent = running
+        ? `⏳ 実行中（${Math.round(now - st.started)}秒経過${stageName ? '・' + stageName + 'の段階' : ''}）`
+        : (st.message || document.getElementById('runStatus').textContent);
+    const table = document.getElementById('runStages');
+    table.replaceChildren();
+    for (const [name, record] of Object.entries(p.stages || {})) {
+        const active = running && name === p.current;
+        const seconds = (record.seconds || 0) + (active && p.current_started ? now - p.current_started : 0);
+        const counters = Object.entries(record).filter(([k]) => !STAGE_FIELDS.includes(k)).map(([k, v]) => `${k} ${v}`);
+        if (record.retries) counters.unshift(`リトライ${record.retries}回（待機${(record.retry_wait_seconds || 0).toFixed(1)}秒）`);
+        const row = table.insertRow();
+        row.className = active ? 'active' : '';
+        row.insertCell().textContent = (active ? '⏳ ' : '') + (STAGE_LABELS[name] || name);
+        const cell = row.insertCell();
+        cell.className = 'counters';
+        cell.textContent = counters.join(' / ');
+        const sec = row.insertCell();
+        sec.className = 'sec';
+        sec.textContent = seconds.toFixed(1) + '秒';
+    }
+}
+function connectRun() {
+    const log = document.getElementById('runLog');
+    const source = new EventSource('/run/events');
+    source.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (data.run !== runId) { runId = data.run; log.textContent = ''; }
+        if (data.log.length) {
+            log.style.display = 'block';
+            log.textContent += data.log.join('\\n') + '\\n';
+            log.scrollTop = log.scrollHeight;
+        }
+        runState = data;
+        renderRun();
+    };
+}
+async function startRun() {
+    if (!confirm('取得→要約→送信を今すぐ実行します（本日送信済みの場合は送信しません）。よろしいですか？')) return;
+    document.getElementById('runBtn').disabled = true;
+    try {
+        const resp = await fetch('/run', { method: 'POST' });
+        const data = await resp.json();
+        if (!data.started) document.getElementById('runStatus').textContent = data.message;
+    } catch (e) { document.getElementById('runStatus').textContent = '❌ エラー: ' + e.message; }
+}
+setInterval(() => { if (runState && runState.status === 'running') renderRun(); }, 1000);
+connectRun();
 </script>
 </body></html>
 """
@@ -517,13 +638,43 @@ HELP_TEMPLATE += """
 
 @app.route("/")
 def index():
-    s = load_settings()
+    try:
+        s = load_settings()
+    except (SettingsError, ValueError) as e:
+        flash(f"❌ {e}", "error")
+        s = dict(DEFAULTS)
     last_run = None
     last_run_file = os.path.join(SCRIPT_DIR, ".last_run")
     if os.path.exists(last_run_file):
         with open(last_run_file, "r") as f:
             last_run = f.read().strip()
-    return render_template_string(HTML_TEMPLATE, s=s, last_run=last_run)
+    return render_template_string(HTML_TEMPLATE, s=s, last_run=last_run, chart=_history_chart(),
+                                  outbox_items=outbox.pending(due_only=False),
+                                  recipients_text=_format_recipients(s.get("recipients", [])),
+                                  stage_labels=metrics.STAGE_LABELS)
+
+
+def _format_recipients(recipients):
+    """宛先の設定をテキストエリア用の「アドレス リスト…」形式に変換"""
+    lines = []
+    for r in recipients:
+        if isinstance(r, dict):
+            lines.append(" ".join([r.get("email", "")] + r.get("lists", [])))
+        else:
+            lines.append(r)
+    return "\n".join(lines)
+
+
+def _parse_recipients(text):
+    """テキストエリアの「アドレス [リストURL/ID …]」を宛先の設定に変換"""
+    recipients = []
+    for line in text.splitlines():
+        parts = line.replace(",", " ").split()
+        if not parts:
+            continue
+        email, lists = parts[0], parts[1:]
+        recipients.append({"email": email, "lists": lists} if lists else email)
+    return recipients
 
 
 @app.route("/help")
@@ -531,28 +682,92 @@ def help_page():
     return render_template_string(HELP_TEMPLATE)
 
 
+@app.route("/metrics")
+def metrics_endpoint():
+    """実行ごとの計測値を Prometheus のテキスト形式で返す"""
+    return Response(metrics.prometheus_text(metrics.load_history(), metrics.load_totals()),
+                    mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+
+# --- 所要時間グラフ ---
+
+CHART_COLORS = {"fetch": "#1d9bf0", "preprocess": "#7856ff", "summarize": "#00ba7c", "send": "#ffd400"}
+CHART_RUNS = 14
+
+
+def _history_chart(width=600, height=120, gap=6):
+    """直近の実行の段階別所要時間を積み上げ棒グラフ（SVG）用の座標に変換"""
+    runs = metrics.load_history(CHART_RUNS)
+    chart = {
+        "width": width, "height": height, "bars": [], "max_seconds": 0,
+        "legend": [(metrics.STAGE_LABELS[name], color) for name, color in CHART_COLORS.items()],
+    }
+    if not runs:
+        return chart
+    totals = [sum(r.get("seconds", 0) for r in run.get("stages", {}).values()) for run in runs]
+    chart["max_seconds"] = max(max(totals), 0.001)
+    chart["bar_width"] = round((width - gap * (CHART_RUNS - 1)) / CHART_RUNS, 1)
+    for i, run in enumerate(runs):
+        y = height
+        segments = []
+        parts = []
+        for name, color in CHART_COLORS.items():
+            seconds = run.get("stages", {}).get(name, {}).get("seconds", 0)
+            h = seconds / chart["max_seconds"] * (height - 4)
+            y -= h
+            segments.append({"y": round(y, 1), "h": round(h, 1), "color": color})
+            stage = run.get("stages", {}).get(name, {})
+            retries = f"・リトライ{stage['retries']}回" if stage.get("retries") else ""
+            parts.append(f"{metrics.STAGE_LABELS[name]} {seconds:.1f}秒{retries}")
+        chart["bars"].append({
+            "x": round(i * (chart["bar_width"] + gap), 1),
+            "segments": segments,
+            "failed": run.get("status") in ("error", "queued"),
+            "title": f"{run.get('date', '')} ({run.get('status')})\n" + "\n".join(parts),
+        })
+    return chart
+
+
 @app.route("/save", methods=["POST"])
 def save():
-    data = {
-        "list_url": request.form.get("list_url", "").strip(),
+    list_urls = [line.strip() for line in request.form.get("list_urls", "").splitlines() if line.strip()]
+    try:
+        data = load_settings()
+    except (SettingsError, ValueError):
+        # 壊れた設定（読み込めないJSONも含む）はフォームの内容で上書きする
+        data = dict(DEFAULTS)
+    try:
+        fetch_concurrency = int(request.form.get("fetch_concurrency") or 4)
+        fetch_timeout = int(request.form.get("fetch_timeout") or 120)
+    except ValueError:
+        flash("❌ 同時取得数・タイムアウトは数値で入力してください", "error")
+        return redirect(url_for("index"))
+    data.update({
+        "list_urls": list_urls,
+        "fetch_concurrency": fetch_concurrency,
+        "fetch_timeout": fetch_timeout,
         "gemini_api_key": request.form.get("gemini_api_key", "").strip(),
         "gmail_user": request.form.get("gmail_user", "").strip(),
         "gmail_app_password": request.form.get("gmail_app_password", "").strip(),
+        "recipients": _parse_recipients(request.form.get("recipients", "")),
         "schedule_time": request.form.get("schedule_time", "07:00").strip(),
         "x_cookies": {
             "auth_token": request.form.get("auth_token", "").strip(),
             "ct0": request.form.get("ct0", "").strip(),
             "twid": request.form.get("twid", "").strip(),
         }
-    }
-    save_settings(data)
+    })
+    try:
+        save_settings(data)
+    except SettingsError as e:
+        flash(f"❌ {e}", "error")
+        return redirect(url_for("index"))
 
     # Register task scheduler (background, silent, run if missed)
     schedule_time = data.get("schedule_time", "07:00")
     vbs_path = os.path.join(SCRIPT_DIR, "run_silent.vbs")
     task_name = "X-AutoSummary"
     try:
-        import subprocess
         # Use PowerShell to register task with StartWhenAvailable
         hour, minute = schedule_time.split(":")
         ps_script = f'''
@@ -578,64 +793,251 @@ Write-Output "OK"
     return redirect(url_for("index"))
 
 
-@app.route("/test", methods=["POST"])
-def test_run():
-    results = []
-    success = True
-    s = load_settings()
+# --- 接続テスト ---
+
+TEST_TIMEOUT = 20  # 各チェックの制限時間（秒）
+TEST_CACHE_TTL = 60  # 同じ設定でのテスト結果を使い回す時間（秒）
+_test_cache = {}
+_test_cache_lock = threading.Lock()
 
+
+def _check_x(s):
     if not s["x_cookies"].get("auth_token"):
-        results.append("❌ X Cookie: auth_token が未設定")
-        success = False
-    else:
-        try:
-            from twikit import Client as TwikitClient
-            client = TwikitClient('ja-JP')
-            client.set_cookies(s["x_cookies"])
-            list_id = s["list_url"].split("/")[-1]
-            tweets = asyncio.run(client.get_list_tweets(list_id))
-            results.append(f"✅ X接続OK: {len(tweets)}件のツイート取得")
-        except Exception as e:
-            results.append(f"❌ X接続エラー: {e}")
-            success = False
+        return False, ["❌ X Cookie: auth_token が未設定"]
+    if not s["list_urls"]:
+        return False, ["❌ X接続エラー: リストURLが未設定"]
+    from twikit import Client as TwikitClient
+    client = TwikitClient('ja-JP')
+    client.set_cookies(s["x_cookies"])
+    # main.py の取得と同じレート制限の状態を使い、テストで上限を使い切らないようにする
+    rate_limit.shared().attach(client)
+    list_ids = [url.rstrip("/").split("/")[-1] for url in s["list_urls"]]
+
+    async def fetch_lists():
+        return await asyncio.wait_for(
+            asyncio.gather(*(client.get_list_tweets(list_id) for list_id in list_ids)),
+            timeout=TEST_TIMEOUT
+        )
 
-    if not s["gemini_api_key"]:
-        results.append("❌ Gemini APIキーが未設定")
-        success = False
-    else:
-        try:
-            from google import genai
-            client = genai.Client(api_key=s["gemini_api_key"])
-            resp = client.models.generate_content(
-                model='gemini-2.5-flash',
-                contents='テスト。「OK」とだけ返してください。'
-            )
-            results.append(f"✅ Gemini API OK: {resp.text[:30]}")
-        except Exception as e:
-            results.append(f"❌ Gemini APIエラー: {e}")
-            success = False
+    return True, [
+        f"✅ X接続OK (List {list_id}): {len(tweets)}件のツイート取得"
+        for list_id, tweets in zip(list_ids, asyncio.run(fetch_lists()))
+    ]
 
+
+def _check_gemini(s):
+    if not s["gemini_api_key"]:
+        return False, ["❌ Gemini APIキーが未設定"]
+    from google import genai
+    from google.genai import types
+    client = genai.Client(
+        api_key=s["gemini_api_key"],
+        http_options=types.HttpOptions(timeout=TEST_TIMEOUT * 1000)
+    )
+    # 生成はせずモデル情報の取得だけで APIキーとモデルの利用可否を確認（クォータを消費しない）
+    model = client.models.get(model='gemini-2.5-flash')
+    return True, [f"✅ Gemini API OK: {model.display_name or model.name}"]
+
+
+def _check_gmail(s):
     if not s["gmail_app_password"]:
-        results.append("❌ Gmailアプリパスワードが未設定")
-        success = False
-    else:
-        try:
-            import smtplib
-            with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-                server.login(s["gmail_user"], s["gmail_app_password"])
-            results.append(f"✅ Gmail接続OK: {s['gmail_user']}")
-        except Exception as e:
-            results.append(f"❌ Gmail接続エラー: {e}")
-            success = False
+        return False, ["❌ Gmailアプリパスワードが未設定"]
+    import mailer
+    # main.py の送信と同じ手順（SSL か STARTTLS で暗号化してからログイン）で確認する
+    server = mailer.connect(s["smtp_host"], s["smtp_port"], s["gmail_user"], s["gmail_app_password"],
+                            s["smtp_ssl"], s["smtp_allow_plaintext"], TEST_TIMEOUT)
+    server.quit()
+    return True, [f"✅ Gmail接続OK: {s['gmail_user']}"]
+
+
+# (チェック名, エラー表示名, 関数, 結果に影響する設定キー)
+TEST_CHECKS = [
+    ("x", "X接続エラー", _check_x, ("x_cookies", "list_urls")),
+    ("gemini", "Gemini APIエラー", _check_gemini, ("gemini_api_key",)),
+    ("gmail", "Gmail接続エラー", _check_gmail,
+     ("gmail_user", "gmail_app_password", "smtp_host", "smtp_port", "smtp_ssl", "smtp_allow_plaintext")),
+]
+
+
+def _run_check(s, name, error_label, func, keys):
+    """1つのチェックを実行（同じ設定で TEST_CACHE_TTL 秒以内の成功結果があれば使い回す）"""
+    cache_key = (name, json.dumps([s.get(k) for k in keys], sort_keys=True))
+    with _test_cache_lock:
+        cached = _test_cache.get(cache_key)
+    if cached and time.time() - cached[0] < TEST_CACHE_TTL:
+        ok, lines = cached[1]
+        return ok, [line + " (キャッシュ)" for line in lines]
+    try:
+        result = func(s)
+    except Exception as e:
+        reason = "タイムアウト" if isinstance(e, (asyncio.TimeoutError, TimeoutError)) else e
+        return False, [f"❌ {error_label}: {reason}"]
+    if result[0]:
+        with _test_cache_lock:
+            _test_cache[cache_key] = (time.time(), result)
+    return result
+
 
-    return jsonify({"success": success, "message": "\n".join(results)})
+@app.route("/test", methods=["POST"])
+def test_run():
+    """3つの接続チェックを並行実行し、終わったものから1行ずつ (NDJSON) 返す"""
+    try:
+        s = load_settings()
+    except (SettingsError, ValueError) as e:
+        body = json.dumps({"check": "settings", "success": False, "message": f"❌ {e}"}, ensure_ascii=False)
+        return Response(body + "\n" + json.dumps({"done": True, "success": False}) + "\n",
+                        mimetype="application/x-ndjson")
+
+    def generate():
+        success = True
+        with ThreadPoolExecutor(max_workers=len(TEST_CHECKS)) as executor:
+            futures = {
+                executor.submit(_run_check, s, *check): check[0] for check in TEST_CHECKS
+            }
+            for future in as_completed(futures):
+                ok, lines = future.result()
+                success = success and ok
+                yield json.dumps({"check": futures[future], "success": ok, "message": "\n".join(lines)},
+                                 ensure_ascii=False) + "\n"
+        yield json.dumps({"done": True, "success": success}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+# --- 今すぐ実行 ---
+
+RUN_LOG_LINES = 300  # 画面に送る実行ログの行数（古いものから捨てる）
+SSE_KEEPALIVE = 15  # 変化がなくてもコメント行を送る間隔（秒。切断されたブラウザの検出も兼ねる）
+RUN_MESSAGES = {
+    "ok": "✅ 送信しました",
+    "empty": "✅ 新しい投稿がないため送信しませんでした",
+    "already_sent": "📬 本日はすでに送信済みのため、送信しませんでした",
+    "queued": "⚠️ 送信に失敗したため、送信待ちに保存しました（次回の実行で再送）",
+    "error": "❌ エラーで終了しました（ログを確認してください）",
+}
+
+
+class PipelineRunner:
+    """main.py を別プロセスで実行し、進捗とログを保持する（同時に実行するのは1つだけ）
+
+    実行は1スレッドのワーカーで行うため、Flask のリクエストは実行の開始を頼んだらすぐ返る。
+    進捗は main.py --progress が書く1行のJSON（metrics.print_progress）から受け取る。
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pipeline")
+        self._cond = threading.Condition()
+        self.version = 0
+        self.run = 0
+        self.state = {"status": "idle"}
+        self.lines = deque(maxlen=RUN_LOG_LINES)  # (通し番号, 行)
+        self.line_seq = 0
+
+    def _changed(self):
+        self.version += 1
+        self._cond.notify_all()
+
+    def start(self):
+        """実行を開始（すでに実行中なら False）"""
+        with self._cond:
+            if self.state["status"] == "running":
+                return False
+            self.run += 1
+            self.lines.clear()
+            self.state = {"status": "running", "started": time.time(), "progress": None}
+            self._changed()
+        self._executor.submit(self._run)
+        return True
+
+    def _log(self, line):
+        with self._cond:
+            self.line_seq += 1
+            self.lines.append((self.line_seq, line))
+            self._changed()
+
+    def _run(self):
+        command = [sys.executable, "-u", os.path.join(SCRIPT_DIR, "main.py"), "--progress"]
+        try:
+            process = subprocess.Popen(
+                command, cwd=SCRIPT_DIR, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                text=True, encoding="utf-8", errors="replace",
+                env={**os.environ, "PYTHONIOENCODING": "utf-8"},
+            )
+        except OSError as e:
+            self._log(f"❌ main.py を起動できません: {e}")
+            self._finish(None)
+            return
+        for line in process.stdout:
+            line = line.rstrip("\n")
+            if line.startswith(metrics.PROGRESS_PREFIX):
+                try:
+                    progress = json.loads(line[len(metrics.PROGRESS_PREFIX):])
+                except ValueError:
+                    continue
+                with self._cond:
+                    self.state["progress"] = progress
+                    self._changed()
+            else:
+                self._log(line)
+        self._finish(process.wait())
+
+    def _finish(self, returncode):
+        with self._cond:
+            progress = self.state.get("progress") or {}
+            result = progress.get("status") if progress.get("status") != "running" else None
+            if returncode != 0 or result is None:
+                result = "error"
+            self.state.update({
+                "status": "ok" if result != "error" else "error",
+                "finished": time.time(),
+                "returncode": returncode,
+                "message": RUN_MESSAGES.get(result, RUN_MESSAGES["error"]),
+            })
+            self._changed()
+
+    def wait(self, version, after_line, timeout):
+        """version から変化があるまで待ち、(version, 状態, after_line より後のログ) を返す"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != version, timeout)
+            lines = [(seq, line) for seq, line in self.lines if seq > after_line]
+            return self.version, {**self.state, "run": self.run}, lines
+
+
+runner = PipelineRunner()
+
+
+@app.route("/run", methods=["POST"])
+def run_now():
+    """パイプラインをバックグラウンドで開始（実行中なら開始しない）"""
+    if runner.start():
+        return {"started": True, "message": "▶ 実行を開始しました"}
+    return {"started": False, "message": "⏳ すでに実行中です。終わってから実行してください"}, 409
+
+
+@app.route("/run/events")
+def run_events():
+    """実行の状態・段階ごとの進捗・新しいログ行を Server-Sent Events で送り続ける"""
+    def generate():
+        version, after_line = -1, 0
+        while True:
+            new_version, state, lines = runner.wait(version, after_line, SSE_KEEPALIVE)
+            if new_version == version:
+                yield ": keepalive\n\n"
+                continue
+            version = new_version
+            if lines:
+                after_line = lines[-1][0]
+            state["log"] = [line for _, line in lines]
+            yield f"data: {json.dumps(state, ensure_ascii=False)}\n\n"
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 # --- 起動 ---
 
 if __name__ == "__main__":
     import webbrowser
-    import threading
 
     print("=" * 50)
     print("Xリスト自動要約システム - 設定画面")
@@ -646,4 +1048,5 @@ if __name__ == "__main__":
     print()
 
     threading.Timer(1.5, lambda: webbrowser.open("http://localhost:5000")).start()
-    app.run(host="127.0.0.1", port=5000, debug=False)
+    # 「今すぐ実行」の進捗（SSE）はリクエストを開いたままにするため、スレッドで並行に処理する
+    app.run(host="127.0.0.1", port=5000, debug=False, threaded=True)